@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the process and plot hot paths.
+
+Times process.crashes, recover and drawdown on synthetic random walks of
+1k to 1M bars, the batch functions on many-symbol panels and plot.crashes /
+plot.recover with the Agg backend, and records the peak memory of each
+case. Also times the start-up of main.py --help and main.py query and
+flags either loading matplotlib or yfinance. Runs offline with the memo
+cache off. Results are saved per commit under data/bench so runs can be
+compared.
+
+Usage:
+    python bench.py                      # full run, saved as data/bench/<commit>.json
+    python bench.py --quick              # small sizes only
+    python bench.py --compare 720ab2a    # compare with a saved run
+"""
+
+import argparse
+import datetime as dt
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import memo
+import process
+
+BENCH_DIR = 'data/bench'
+
+SIZES = (1_000, 10_000, 100_000, 1_000_000)
+QUICK_SIZES = (1_000, 10_000)
+PANELS = ((100, 2_500), (500, 2_500))
+QUICK_PANELS = ((20, 1_000),)
+# plot.* draw every episode, so they are only timed up to this many bars
+PLOT_MAX = 100_000
+
+# main.py invocations whose start-up is timed, and modules they must not load
+STARTUP = {
+    'startup.help': ['--help'],
+    'startup.query': ['query', '^GSPC'],
+}
+HEAVY_MODULES = ('matplotlib', 'yfinance', 'seaborn')
+
+
+def random_walk(n, seed=0, start='1927-12-30'):
+    """(d, value) frame of a geometric random walk on business days."""
+    rng = np.random.default_rng(seed)
+    values = 100 * np.exp(np.cumsum(rng.normal(0.0003, 0.012, n)))
+
+    return pd.DataFrame({'d': pd.bdate_range(start, periods=n), 'value': values})
+
+
+def random_panel(symbols, n, seed=0):
+    """Long (symbol, d, value) frame of independent random walks."""
+    frames = [random_walk(n, seed + i).assign(symbol='S{:04d}'.format(i)) for i in range(symbols)]
+
+    return pd.concat(frames, ignore_index=True)[['symbol', 'd', 'value']]
+
+
+def measure(func, *args, repeat=3):
+    """Best wall time of repeat calls and the peak traced memory of one more, in MB."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return min(times), peak / 2 ** 20
+
+
+def _plot():
+    import matplotlib
+    matplotlib.use('Agg')
+    import plot
+
+    return plot
+
+
+def cases(sizes=SIZES, panels=PANELS, plots=True):
+    """Yield (name, size, function, args) for every benchmark."""
+    for n in sizes:
+        data = random_walk(n)
+        yield 'process.crashes', n, process.crashes.uncached, (data,)
+        yield 'process.recover', n, process.recover.uncached, (data,)
+        yield 'process.drawdown', n, process.drawdown.uncached, (data,)
+
+        if plots and n <= PLOT_MAX:
+            plot = _plot()
+            # save=False calls plt.show, which does nothing on Agg
+            yield 'plot.crashes', n, plot.crashes, (process.crashes.uncached(data), 'BENCH')
+            yield 'plot.recover', n, plot.recover, (process.recover.uncached(data), 'BENCH')
+
+    for symbols, n in panels:
+        data = random_panel(symbols, n)
+        size = '{}x{}'.format(symbols, n)
+        yield 'process.crashes_batch', size, process.crashes_batch.uncached, (data,)
+        yield 'process.recover_batch', size, process.recover_batch.uncached, (data,)
+        yield 'process.episode_table', size, process.episode_table.uncached, (data,)
+
+
+def startup(args, repeat=3):
+    """
+    Best wall time of running main.py with args in an empty directory, and
+    the HEAVY_MODULES it imported.
+    """
+    main = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+    with tempfile.TemporaryDirectory() as cwd:
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, main] + args, cwd=cwd, capture_output=True, check=True)
+            times.append(time.perf_counter() - start)
+
+        imports = subprocess.run([sys.executable, '-X', 'importtime', main] + args, cwd=cwd,
+                                 capture_output=True, text=True, check=True).stderr
+    modules = {line.split('|')[-1].strip() for line in imports.splitlines()}
+
+    return min(times), sorted(name for name in HEAVY_MODULES if name in modules)
+
+
+def commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'local'
+
+
+def run(sizes=SIZES, panels=PANELS, plots=True, repeat=3):
+    """Run every case and return the results dict."""
+    memo.enabled = False
+    results = []
+    for name, size, func, args in cases(sizes, panels, plots):
+        seconds, peak_mb = measure(func, *args, repeat=repeat)
+        results.append({'name': name, 'size': str(size), 'seconds': seconds, 'peak_mb': peak_mb})
+        print('{:<24} {:>10} {:>10.4f}s {:>9.1f} MB'.format(name, size, seconds, peak_mb))
+
+    for name, args in STARTUP.items():
+        seconds, heavy = startup(args, repeat)
+        results.append({'name': name, 'size': '-', 'seconds': seconds, 'peak_mb': None,
+                        'heavy_imports': heavy})
+        print('{:<24} {:>10} {:>10.4f}s {}'.format(name, '-', seconds,
+                                                    'imports ' + ', '.join(heavy) if heavy else ''))
+
+    return {
+        'commit': commit(),
+        'date': dt.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'results': results,
+    }
+
+
+def bench_path(name):
+    return os.path.join(BENCH_DIR, '{}.json'.format(name))
+
+
+def save(report, name=None):
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    path = bench_path(name or report['commit'])
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=1)
+
+    return path
+
+
+def load(name):
+    with open(bench_path(name) if not name.endswith('.json') else name) as f:
+        return json.load(f)
+
+
+def compare(base, report):
+    """Frame of time and memory ratios of report against base, per case."""
+    key = ['name', 'size']
+    merged = pd.DataFrame(base['results']).merge(pd.DataFrame(report['results']), on=key,
+                                                 suffixes=('_base', ''))
+    merged['time_ratio'] = merged['seconds'] / merged['seconds_base']
+    merged['memory_ratio'] = merged['peak_mb'] / merged['peak_mb_base']
+
+    return merged[key + ['seconds_base', 'seconds', 'time_ratio', 'peak_mb_base', 'peak_mb',
+                         'memory_ratio']]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the process and plot hot paths')
+    parser.add_argument('--quick', action='store_true', help='Only run the small sizes')
+    parser.add_argument('--no-plots', action='store_true', help='Skip the plot.* benchmarks')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed calls per case (default: 3)')
+    parser.add_argument('--name', type=str, help='Save as data/bench/<name>.json (default: commit)')
+    parser.add_argument('--compare', type=str, help='Saved run (commit or path) to compare against')
+
+    args = parser.parse_args()
+
+    report = run(QUICK_SIZES if args.quick else SIZES, QUICK_PANELS if args.quick else PANELS,
+                 not args.no_plots, args.repeat)
+    print(f"Results saved to {save(report, args.name)}")
+
+    if args.compare:
+        with pd.option_context('display.width', 200, 'display.float_format', '{:.4f}'.format):
+            print(compare(load(args.compare), report).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,50 @@
 import os
+import pickle
+import numpy as np
 import pandas as pd
 
+# Storage format for cached frames: 'npz' keeps typed NumPy columns (dates
+# stay datetime64, nothing is parsed on load), 'parquet' needs pyarrow and
+# 'csv' is the original text format. Files in any format are still read.
+FORMAT = 'npz'
+FORMATS = ('npz', 'parquet', 'csv')
 
-def save_crashes(data, symbol):
+
+def _write(df, path, fmt):
+    if fmt == 'npz':
+        save_columns(df, path)
+    elif fmt == 'parquet':
+        df.to_parquet(path, index=False)
+    elif fmt == 'csv':
+        df.to_csv(path, index=False)
+    else:
+        raise ValueError('Unknown cache format: {}'.format(fmt))
+
+
+def _read(path, fmt, columns=None):
+    if fmt == 'npz':
+        return load_columns(path, columns)
+    if fmt == 'parquet':
+        return pd.read_parquet(path, columns=columns)
+    df = pd.read_csv(path, usecols=columns)
+    if 'd' in df.columns:
+        df['d'] = pd.to_datetime(df['d'])
+
+    return df
+
+
+def save_crashes(data, symbol, fmt=None):
     #    date_str = dt.datetime.today().isoformat()[:10]
-    data.to_json('data/crashes_{}.json'.format(symbol))
-    data.to_csv('data/crashes_{}.csv'.format(symbol))
+    fmt = fmt or FORMAT
+    if fmt == 'csv':
+        paths = ['data/crashes_{}.json'.format(symbol), 'data/crashes_{}.csv'.format(symbol)]
+        data.to_json(paths[0])
+        data.to_csv(paths[1])
+    else:
+        paths = ['data/crashes_{}.{}'.format(symbol, fmt)]
+        _write(data, paths[0], fmt)
+
+    return paths
 
 
 def save_drawdown(data, symbol):
@@ -13,16 +52,98 @@ def save_drawdown(data, symbol):
     data.to_json('data/drawdown_{}.'.format(symbol))
 
 
-def save_ibov_equity(df, symbol):
-    df.to_csv('data/ibov/{}.csv'.format(symbol), index=False)
+def _equity_path(symbol, fmt):
+    return 'data/ibov/{}.{}'.format(symbol, fmt)
+
+
+def _equity_format(symbol):
+    for fmt in FORMATS:
+        if os.path.exists(_equity_path(symbol, fmt)):
+            return fmt
+
+    return None
+
+
+def save_ibov_equity(df, symbol, fmt=None):
+    fmt = fmt or FORMAT
+    _write(df, _equity_path(symbol, fmt), fmt)
 
 
 def check_equity_data_availability(symbol):
-    return os.path.exists('data/ibov/{}.csv'.format(symbol))
+    return _equity_format(symbol) is not None
 
 
-def load_equity_data(symbol):
-    df = pd.read_csv('data/ibov/{}.csv'.format(symbol))
-    df['d'] = pd.to_datetime(df['d'])
+def load_equity_data(symbol, columns=None):
+    fmt = _equity_format(symbol)
+    if fmt is None:
+        raise FileNotFoundError('No cached data for {}'.format(symbol))
 
-    return df
+    return _read(_equity_path(symbol, fmt), fmt, columns)
+
+
+def list_equities():
+    """Return the symbols that have cached equity data, in any format."""
+    names = set()
+    for name in os.listdir('data/ibov'):
+        symbol, ext = os.path.splitext(name)
+        if ext[1:] in FORMATS:
+            names.add(symbol)
+
+    return sorted(names)
+
+
+def save_arrays(path, **arrays):
+    """Write named arrays into one .npz file."""
+    tmp = '{}.tmp'.format(path)
+    with open(tmp, 'wb') as f:
+        np.savez(f, **arrays)
+    # Replace atomically so readers never see a half-written file
+    os.replace(tmp, path)
+
+
+def save_columns(df, path):
+    """Write each column of df as a typed array into one .npz file."""
+    save_arrays(path, **{c: df[c].to_numpy() for c in df.columns})
+
+
+def load_columns(path, columns=None):
+    """
+    Read a file written by save_columns, optionally only some columns; the
+    others are not read from disk.
+    """
+    with np.load(path) as f:
+        names = f.files if columns is None else columns
+        return pd.DataFrame({c: f[c] for c in names})
+
+
+def save_series(series, path):
+    """Write a prices.PriceSeries in the save_columns layout, so load_columns can read it."""
+    save_arrays(path, d=series.d, value=series.values)
+
+
+def load_series(path, symbol=None, dtype=np.float64):
+    """Read the d and value columns of a save_columns file as a prices.PriceSeries."""
+    import prices
+
+    with np.load(path) as f:
+        days = f['d'].astype('datetime64[D]').view(np.int64)
+        return prices.PriceSeries(days, f['value'].astype(dtype, copy=False), symbol)
+
+
+def save_state(state, name):
+    """Persist an incremental state object such as process.CrashState."""
+    os.makedirs('data/state', exist_ok=True)
+    path = 'data/state/{}.pkl'.format(name)
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp, 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    # Replace atomically so an interrupted run leaves the previous state
+    os.replace(tmp, path)
+
+
+def load_state(name):
+    try:
+        with open('data/state/{}.pkl'.format(name), 'rb') as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,239 @@
+"""
+Exchange calendars and calendar-aligned panels.
+
+Holidays of the NYSE and B3 are generated from their rules, kept in this
+module, so no calendar package or download is needed. align() puts many
+series on one session calendar with a single scatter and forward fill
+over a (dates x symbols) array, and resample() takes the weekly, monthly,
+... closes of the result in one pass. Both return a panel.Panel, so a
+cross-market comparison is a slice of it.
+
+The rules follow each exchange's current schedule, with the years the
+newer holidays started; one-off closures are listed in SPECIAL_CLOSURES
+from 2001 on. Early closes count as sessions.
+"""
+
+import datetime as dt
+import functools
+
+import numpy as np
+import pandas as pd
+
+import panel
+import symbols
+
+MARKETS = ('NYSE', 'B3')
+
+# Symbols not told apart by their suffix; the equity cache drops '.SA'
+SYMBOL_MARKETS = {'^BVSP': 'B3'}
+SYMBOL_MARKETS.update({symbol: 'B3' for symbol in symbols.ibrxa_symbols})
+
+SPECIAL_CLOSURES = {
+    'NYSE': ['2001-09-11', '2001-09-12', '2001-09-13', '2001-09-14', '2004-06-11', '2007-01-02',
+             '2012-10-29', '2012-10-30', '2018-12-05', '2025-01-09'],
+    'B3': [],
+}
+
+
+def market(symbol):
+    """Exchange whose calendar symbol trades on: 'B3' for ^BVSP and B3 tickers, else 'NYSE'."""
+    if symbol in SYMBOL_MARKETS:
+        return SYMBOL_MARKETS[symbol]
+
+    return 'B3' if symbol.endswith('.SA') else 'NYSE'
+
+
+def _easter(year):
+    """Gregorian Easter Sunday (anonymous Gregorian algorithm)."""
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+
+    return dt.date(year, month, day + 1)
+
+
+def _weekday(year, month, weekday, n):
+    """n-th (1-based, -1 for last) weekday (Monday=0) of a month."""
+    if n > 0:
+        first = dt.date(year, month, 1)
+        return first + dt.timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = dt.date(year + month // 12, month % 12 + 1, 1) - dt.timedelta(days=1)
+
+    return last - dt.timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def _observed(day):
+    """NYSE rule: a holiday on Saturday is taken on Friday, on Sunday on Monday."""
+    if day.weekday() == 5:
+        return day - dt.timedelta(days=1)
+    if day.weekday() == 6:
+        return day + dt.timedelta(days=1)
+
+    return day
+
+
+def _nyse(year):
+    easter = _easter(year)
+    days = [
+        easter - dt.timedelta(days=2),
+        _observed(dt.date(year, 7, 4)),
+        _weekday(year, 9, 0, 1),
+        _weekday(year, 11, 3, 4),
+        _observed(dt.date(year, 12, 25)),
+    ]
+    # New Year's Day on a Saturday is not moved to the previous year
+    if dt.date(year, 1, 1).weekday() != 5:
+        days.append(_observed(dt.date(year, 1, 1)))
+    if year >= 1998:
+        days.append(_weekday(year, 1, 0, 3))
+    if year >= 1971:
+        days += [_weekday(year, 2, 0, 3), _weekday(year, 5, 0, -1)]
+    else:
+        days += [_observed(dt.date(year, 2, 22)), _observed(dt.date(year, 5, 30))]
+    if year >= 2022:
+        days.append(_observed(dt.date(year, 6, 19)))
+
+    return days
+
+
+def _b3(year):
+    easter = _easter(year)
+    days = [
+        dt.date(year, 1, 1),
+        easter - dt.timedelta(days=48),
+        easter - dt.timedelta(days=47),
+        easter - dt.timedelta(days=2),
+        dt.date(year, 4, 21),
+        dt.date(year, 5, 1),
+        easter + dt.timedelta(days=60),
+        dt.date(year, 9, 7),
+        dt.date(year, 10, 12),
+        dt.date(year, 11, 2),
+        dt.date(year, 11, 15),
+        dt.date(year, 12, 24),
+        dt.date(year, 12, 25),
+    ]
+    # No trading on the last weekday of the year
+    last = dt.date(year, 12, 31)
+    days.append(last - dt.timedelta(days=max(0, last.weekday() - 4)))
+    # Sao Paulo holidays, B3 trades on them since 2022; Nov 20 is national from 2024
+    if year <= 2021:
+        days += [dt.date(year, 1, 25), dt.date(year, 7, 9)]
+    if year <= 2021 or year >= 2024:
+        days.append(dt.date(year, 11, 20))
+
+    return days
+
+
+RULES = {'NYSE': _nyse, 'B3': _b3}
+
+
+@functools.lru_cache(maxsize=None)
+def _year_holidays(name, year):
+    days = [day for day in RULES[name](year) if day.year == year]
+    days += [day for day in pd.to_datetime(SPECIAL_CLOSURES[name]).date if day.year == year]
+
+    return np.unique(np.array(days, dtype='datetime64[D]'))
+
+
+def holidays(name, start, end):
+    """Weekday closures of exchange name between start and end (inclusive)."""
+    start, end = np.datetime64(start, 'D'), np.datetime64(end, 'D')
+    years = range(pd.Timestamp(start).year, pd.Timestamp(end).year + 1)
+    days = np.concatenate([_year_holidays(name, year) for year in years])
+
+    return days[(days >= start) & (days <= end) & np.is_busday(days)]
+
+
+def sessions(name, start, end):
+    """Trading days of exchange name between start and end (inclusive)."""
+    start, end = np.datetime64(start, 'D'), np.datetime64(end, 'D')
+    days = np.arange(start, end + 1, dtype='datetime64[D]')
+
+    return days[np.is_busday(days, holidays=holidays(name, start, end))]
+
+
+def calendar(names, start, end, how='union'):
+    """Sessions of several exchanges combined: 'union' (any is open) or 'intersection'."""
+    days = [sessions(name, start, end) for name in sorted(set(names))]
+    combine = np.union1d if how == 'union' else np.intersect1d
+
+    return functools.reduce(combine, days)
+
+
+def align(data, markets=None, start=None, end=None, how='union', limit=None, column=None):
+    """
+    Map every series of a long (symbol, d, <column>) frame onto one calendar.
+
+    data may also be a panel.Panel. markets maps symbols to an exchange
+    (default: market(symbol)); the calendar combines their sessions with
+    how, from start to end (default: the first and last bar). The value of
+    a symbol at each session is its last bar on or before that day,
+    forward filled for at most limit sessions, and NaN before its first bar
+    or once its own exchange has a session after its last bar. Returns a
+    panel.Panel of the aligned values.
+    """
+    if hasattr(data, 'long'):
+        column = data.column
+        data = data.long()
+    column = column or [c for c in data.columns if c not in ('symbol', 'd')][0]
+
+    codes, names = pd.factorize(data['symbol'])
+    d = data['d'].to_numpy('datetime64[D]')
+    values = data[column].to_numpy(np.float64)
+    # Frames from the store and panels are already in (symbol, d) order
+    if not np.all((codes[1:] > codes[:-1]) | ((codes[1:] == codes[:-1]) & (d[1:] >= d[:-1]))):
+        order = np.lexsort((d, codes))
+        codes, d, values = codes[order], d[order], values[order]
+
+    markets = markets or {}
+    symbol_markets = [markets.get(symbol) or market(symbol) for symbol in names]
+    start = d.min() if start is None else start
+    end = d.max() if end is None else end
+    dates = calendar(symbol_markets, start, end, how)
+
+    # Each bar goes to the first session on or after it; when several bars
+    # of a symbol land on one session the latest wins
+    pos = np.searchsorted(dates, d, 'left')
+    last = np.r_[(codes[1:] != codes[:-1]) | (pos[1:] != pos[:-1]), True]
+    keep = last & (pos < len(dates))
+    grid = np.full((len(dates), len(names)), np.nan)
+    grid[pos[keep], codes[keep]] = values[keep]
+
+    # Forward fill: row of the latest bar at or above each row
+    rows = np.arange(len(dates))[:, None]
+    source = np.maximum.accumulate(np.where(np.isnan(grid), -1, rows), axis=0)
+    aligned = np.take_along_axis(grid, np.maximum(source, 0), axis=0)
+
+    ends = np.r_[codes[1:] != codes[:-1], True]
+    last_row = np.full(len(names), -1)
+    last_row[codes[ends]] = np.minimum(pos[ends], len(dates) - 1)
+    # A symbol is past its last bar once its own exchange has had a session
+    # after it, not on days only another exchange trades
+    opened = {name: np.cumsum(np.isin(dates, sessions(name, start, end))) for name in set(symbol_markets)}
+    own = np.stack([opened[name] for name in symbol_markets], axis=1)
+    ended = own > np.take_along_axis(own, np.maximum(last_row, 0)[None, :], axis=0)
+    stale = (source < 0) | ((rows > last_row[None, :]) & ended)
+    if limit is not None:
+        stale |= rows - source > limit
+    aligned[stale] = np.nan
+
+    return panel.Panel(dates, list(names), aligned, column)
+
+
+RESAMPLE_RULES = {'week': 'W', 'month': 'M', 'quarter': 'Q', 'year': 'Y'}
+
+
+def resample(aligned, rule='month'):
+    """Values of an aligned panel at the last session of each week, month, quarter or year."""
+    periods = pd.DatetimeIndex(aligned.dates).to_period(RESAMPLE_RULES[rule]).asi8
+    last = np.flatnonzero(np.r_[periods[1:] != periods[:-1], True])
+
+    return panel.Panel(aligned.dates[last], aligned.symbols, np.asarray(aligned.values[last]),
+                       aligned.column)
@@ -1,5 +1,5 @@
 import feeder_yahoo
-import pandas as pd
+import event_study
 import matplotlib.pyplot as plt
 import matplotlib.ticker as mtick
 from sklearn.linear_model import LinearRegression
@@ -9,23 +9,10 @@ import numpy as np
 symbol = 'itub4.sa'
 days = 3
 data = feeder_yahoo.get_data(symbol)
-data = feeder_yahoo.process_data(data)
 
-data['mon'] = data['d'].dt.strftime('%Y-%m')
-
-results = []
-for mon in data['mon'].unique():
-    subset = data[data['mon'] == mon]
-    i = subset.index[-1]
-    prev = data.loc[i-(days-1):i+1, 'delta'].prod()-1
-    post = data.loc[i+1:i+days, 'delta'].prod()-1
-        results.append({
-            'mon': mon,
-            'prev': prev,
-            'post': post,
-        })
-
-results = pd.DataFrame(results)
+# Returns over the last `days` sessions of each month and the first `days` of the next
+results = event_study.study(data, windows=[days], rule='month_end')
+results = results.dropna(subset=['prev', 'post'])
 
 model = LinearRegression()
 model.fit(results['prev'].values.reshape((-1,1)), np.array(results['post'].values))
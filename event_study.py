@@ -0,0 +1,94 @@
+"""
+Vectorized event study.
+
+Returns around event dates are differences of the cumulative log price,
+so every window length and every symbol is computed with index offsets
+into one stacked array instead of slicing the frame per event.
+"""
+
+import numpy as np
+import pandas as pd
+
+RULES = {
+    'month_end': 'M',
+    'quarter_end': 'Q',
+    'week_end': 'W',
+    'year_end': 'Y',
+}
+
+
+def _long_frame(data):
+    if 'symbol' not in data.columns:
+        data = data.assign(symbol='')
+    data = data[['symbol', 'd', 'value']].sort_values(['symbol', 'd'], kind='stable')
+
+    return data.reset_index(drop=True)
+
+
+def event_positions(data, rule='month_end'):
+    """
+    Rows of a (symbol, d, value) frame sorted by symbol and date that are events.
+
+    rule is a key of RULES, selecting the last trading day of each period,
+    or a function taking the frame and returning a boolean mask.
+    """
+    if callable(rule):
+        return np.flatnonzero(np.asarray(rule(data), dtype=bool))
+
+    # Integer period ordinals, comparing boxed Period objects is far slower
+    periods = data['d'].dt.to_period(RULES[rule]).array.asi8
+    symbols = data['symbol'].to_numpy()
+    last = np.ones(len(data), dtype=bool)
+    last[:-1] = (periods[1:] != periods[:-1]) | (symbols[1:] != symbols[:-1])
+
+    return np.flatnonzero(last)
+
+
+def study(data, windows=range(1, 21), rule='month_end'):
+    """
+    Pre- and post-event returns for every event, window length and symbol.
+
+    data is a (d, value) frame for one series or a long (symbol, d, value)
+    frame. For an event on row i and a window of n days, prev is the return
+    from row i-n to i and post the return from i to i+n. Windows running
+    past either end of a series are NaN. Returns a long frame with symbol,
+    d, days, prev and post.
+    """
+    data = _long_frame(data)
+    windows = np.asarray(list(windows))
+    events = event_positions(data, rule)
+
+    codes = pd.factorize(data['symbol'])[0]
+    first = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    last = np.r_[first[1:], len(codes)] - 1
+    lo = first[codes[events]][:, None]
+    hi = last[codes[events]][:, None]
+
+    log_value = np.log(data['value'].to_numpy(np.float64))
+    at = events[:, None]
+    before = at - windows[None, :]
+    after = at + windows[None, :]
+
+    prev = np.where(before >= lo, log_value[at] - log_value[np.clip(before, 0, None)], np.nan)
+    post = np.where(after <= hi, log_value[np.clip(after, None, len(log_value) - 1)] - log_value[at], np.nan)
+
+    return pd.DataFrame({
+        'symbol': np.repeat(data['symbol'].to_numpy()[events], len(windows)),
+        'd': np.repeat(data['d'].to_numpy()[events], len(windows)),
+        'days': np.tile(windows, len(events)),
+        'prev': np.expm1(prev.ravel()),
+        'post': np.expm1(post.ravel()),
+    })
+
+
+def summarize(results):
+    """Correlation and regression slope of post on prev per symbol and window."""
+    results = results.dropna(subset=['prev', 'post'])
+    grouped = results.groupby(['symbol', 'days'])
+    summary = grouped.agg(events=('post', 'size'), mean_prev=('prev', 'mean'),
+                          mean_post=('post', 'mean'), std_prev=('prev', 'std'),
+                          std_post=('post', 'std'))
+    summary['corr'] = grouped[['prev', 'post']].corr().xs('post', level=2)['prev']
+    summary['slope'] = summary['corr'] * summary['std_post'] / summary['std_prev']
+
+    return summary.reset_index()
@@ -0,0 +1,109 @@
+"""
+Compact chart payloads for index.html.
+
+Writes the episodes of a crashes() or recover() frame as downsampled
+(ord_d, value) arrays in a small JSON file, so the page draws the charts
+client-side and updating the current drawdown does not need matplotlib.
+Long episodes are reduced with Largest-Triangle-Three-Buckets, which keeps
+the peaks and troughs a plain stride would drop.
+"""
+
+import datetime as dt
+import json
+import os
+
+import numpy as np
+
+import process
+
+EXPORT_DIR = 'data/web'
+
+# Points kept per episode line
+POINTS = 150
+
+
+def lttb(x, y, points):
+    """Indices of the points of (x, y) kept by Largest-Triangle-Three-Buckets."""
+    n = len(x)
+    if points >= n or points < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # points - 2 buckets between the fixed first and last points
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    keep = np.empty(points, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+
+    a = 0
+    for i in range(points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_x = x[hi:edges[i + 2]].mean()
+            next_y = y[hi:edges[i + 2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        # Twice the area of the triangle (a, candidate, next bucket average)
+        area = np.abs((x[a] - next_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (next_y - y[a]))
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+
+    return keep
+
+
+def _selected(data, kind):
+    """Episode summary and lines of the episodes plot.crashes or plot.recover draw."""
+    if kind == 'crashes':
+        summary, lines = process.episode_summary(data, 'delta')
+        return summary[summary['min'] < -.02], lines
+
+    window = data[(data['ord_d'] >= -100) & (data['ord_d'] <= 100)]
+    summary, lines = process.episode_summary(window, 'cumdelta')
+    summary['drawdown'] = window['min'].to_numpy()[summary['start']]
+
+    return summary[summary['drawdown'] < .98], lines
+
+
+def payload(data, kind, symbol, points=POINTS):
+    """Dict with the downsampled episodes of a crashes() or recover() frame."""
+    summary, lines = _selected(data, kind)
+    current = data['value'].max()
+
+    episodes = []
+    for episode in summary.itertuples():
+        ord_d, values = lines[episode.Index]
+        keep = lttb(ord_d, values, points)
+        episodes.append({
+            'year': episode.year,
+            'min': round(float(episode.min), 4),
+            'max': round(float(episode.max), 4),
+            'last': round(float(episode.last), 4),
+            'days': int(episode.last_ord_d),
+            'current': bool(episode.cummax == current),
+            'x': ord_d[keep].tolist(),
+            'y': np.round(values[keep], 4).tolist(),
+        })
+
+    return {
+        'symbol': symbol,
+        'kind': kind,
+        'updated': dt.datetime.today().strftime('%Y-%m-%d'),
+        'episodes': episodes,
+    }
+
+
+def export_path(kind, symbol):
+    return os.path.join(EXPORT_DIR, '{}_{}.json'.format(kind, symbol))
+
+
+def export_chart(kind, data, symbol, points=POINTS):
+    """Write the payload of the 'crashes' or 'recover' chart of symbol and return its path."""
+    path = export_path(kind, symbol)
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump(payload(data, kind, symbol, points), f, separators=(',', ':'))
+    os.replace(tmp, path)
+    print(f"Chart data saved to {path}")
+
+    return path
@@ -1,21 +1,21 @@
-import yfinance as yf
+import numpy as np
 import pandas as pd
 import datetime as dt
+import returns
+import store
 
 
-def get_data(symbol, start_date=dt.datetime(2010, 1, 1)):
-    start = {
-        '^BVSP': dt.datetime(1996, 1, 1),
-        '^GSPC': dt.datetime(1910, 1, 1),
-        '^IXIC': dt.datetime(1910, 1, 1)
-    }
-    
-    # Get the appropriate start date for the symbol or use the provided one
-    effective_start_date = start.get(symbol, start_date)
-    
+def download(symbol, start_date, end_date):
+    # Imported on first download, it takes a good part of a second to load
+    import yfinance as yf
+
     # Download data with auto_adjust=False to get Adjusted Close
-    data = yf.download(symbol, start=effective_start_date, end=dt.datetime.now(), auto_adjust=False, interval='1d')
-    
+    data = yf.download(symbol, start=start_date, end=end_date, auto_adjust=False, interval='1d')
+
+    # Newer yfinance versions return (field, ticker) columns even for one symbol
+    if isinstance(data.columns, pd.MultiIndex):
+        data.columns = data.columns.get_level_values(0)
+
     # Reset index to make Date a column
     data = data.reset_index()
     
@@ -25,14 +25,13 @@ def get_data(symbol, start_date=dt.datetime(2010, 1, 1)):
         'High': 'high',
         'Low': 'low',
         'Close': 'value',  # Using Close instead of Adj Close
+        'Adj Close': 'adj_close',
         'Open': 'open',
         'Volume': 'volume'
     })
     
-    # Create a clean DataFrame with just the required columns
-    x = pd.DataFrame()
-    x['d'] = data['d']
-    x['value'] = data['value']
+    # Keep the price fields the store knows about
+    x = data[['d'] + [c for c in store.FIELDS if c in data.columns]].copy()
     
     # Ensure date is in datetime format
     x['d'] = pd.to_datetime(x['d'])
@@ -41,9 +40,38 @@ def get_data(symbol, start_date=dt.datetime(2010, 1, 1)):
     
     return x
 
+
+# Symbols with a longer history than the default start date
+START_DATES = {
+    '^BVSP': dt.datetime(1996, 1, 1),
+    '^GSPC': dt.datetime(1910, 1, 1),
+    '^IXIC': dt.datetime(1910, 1, 1)
+}
+
+
+def get_data(symbol, start_date=dt.datetime(2010, 1, 1), downloader=download, columns=('value',)):
+    # Every field is stored, columns selects the ones returned (None for all)
+    # Get the appropriate start date for the symbol or use the provided one
+    effective_start_date = START_DATES.get(symbol, start_date)
+    
+    # Only the bars missing from the local store are downloaded
+    x = store.update(symbol, effective_start_date, downloader, columns=columns)
+
+    print(f"Loaded {len(x)} rows of data for {symbol}")
+    
+    return x
+
+
+def get_series(symbol, start_date=dt.datetime(2010, 1, 1), downloader=download, dtype=np.float64):
+    """get_data() as a compact prices.PriceSeries read straight from the store, values as dtype."""
+    series = store.update_series(symbol, START_DATES.get(symbol, start_date), downloader, dtype=dtype)
+
+    print(f"Loaded {len(series)} rows of data for {symbol}")
+
+    return series
+
+
 def process_data(data):
-    data['delta'] = data['close'].diff()
-    data['delta'] = data['delta'].fillna(0)
-    data['delta'] = data['close'] / (data['close'] - data['delta'])
+    data['delta'] = returns.factors(data['value'])
 
     return data
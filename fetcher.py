@@ -0,0 +1,72 @@
+"""
+Concurrent bulk fetcher for the symbols.py universes.
+
+Each symbol goes through feeder_yahoo.get_data (and so the local price
+store) on a thread pool, is transformed and written with
+cache.save_ibov_equity. The network layer is the downloader argument, so a
+stub can stand in for Yahoo Finance.
+"""
+
+import datetime as dt
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import cache
+import feeder_yahoo
+import process
+import symbols
+
+
+def cache_name(symbol):
+    return symbol.replace('.SA', '')
+
+
+def fetch_symbol(symbol, start_date, downloader, retries=3, backoff=1.0):
+    """Fetch one symbol, retrying with exponential backoff on errors or empty data."""
+    for attempt in range(retries + 1):
+        try:
+            data = feeder_yahoo.get_data(symbol, start_date, downloader=downloader)
+            if len(data) == 0:
+                raise ValueError('no data returned for {}'.format(symbol))
+            return data
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(backoff * 2 ** attempt)
+
+
+def fetch_universe(universe, start_date=dt.datetime(2020, 2, 19),
+                   downloader=feeder_yahoo.download, transform=process.crash_2020,
+                   max_workers=8, retries=3, backoff=1.0, skip_cached=True):
+    """
+    Fetch a whole universe concurrently and save each result to the equity cache.
+
+    universe is either a list of tickers or a key of symbols.universes.
+    Returns a report {'fetched': [...], 'skipped': [...], 'failed': {symbol: error}}.
+    """
+    if isinstance(universe, str):
+        universe = symbols.universes[universe]
+
+    report = {'fetched': [], 'skipped': [], 'failed': {}}
+    pending = []
+    for symbol in universe:
+        if skip_cached and cache.check_equity_data_availability(cache_name(symbol)):
+            report['skipped'].append(symbol)
+        else:
+            pending.append(symbol)
+
+    def work(symbol):
+        data = fetch_symbol(symbol, start_date, downloader, retries, backoff)
+        cache.save_ibov_equity(transform(data), cache_name(symbol))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(work, symbol): symbol for symbol in pending}
+        for future in as_completed(futures):
+            symbol = futures[future]
+            try:
+                future.result()
+                report['fetched'].append(symbol)
+            except Exception as e:
+                report['failed'][symbol] = repr(e)
+
+    return report
@@ -0,0 +1,150 @@
+"""
+Stage timing and profiling for analysis runs.
+
+A Run records, for each stage, its wall time, the rows it handled and
+the bytes it wrote, and can profile each stage with cProfile. The report
+is saved as JSON under data/runs. When instrumentation is off, OFF hands
+out one shared do-nothing stage, so the instrumented code costs a
+context manager entry per stage.
+
+    run = instrument.Run(symbol, profile=True)
+    with run.stage('fetch') as stage:
+        data = feeder_yahoo.get_data(symbol)
+        stage.rows = len(data)
+    run.save()
+"""
+
+import cProfile
+import datetime as dt
+import io
+import json
+import os
+import pstats
+import time
+
+RUNS_DIR = 'data/runs'
+
+# Functions listed per profiled stage
+PROFILE_TOP = 15
+
+
+class Stage:
+    def __init__(self, name):
+        self.name = name
+        self.seconds = None
+        self.rows = None
+        self.bytes = 0
+        self.profile = None
+
+    def wrote(self, *paths):
+        """Count the size of files the stage wrote."""
+        for path in paths:
+            if path and os.path.exists(path):
+                self.bytes += os.path.getsize(path)
+
+    def to_dict(self):
+        result = {'name': self.name, 'seconds': self.seconds, 'rows': self.rows, 'bytes': self.bytes}
+        if self.profile is not None:
+            result['profile'] = self.profile
+
+        return result
+
+
+class _Timer:
+    def __init__(self, run, stage):
+        self.run = run
+        self.stage = stage
+        self.profiler = None
+
+    def __enter__(self):
+        if self.run.profile:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        self.start = time.perf_counter()
+
+        return self.stage
+
+    def __exit__(self, *exc):
+        self.stage.seconds = time.perf_counter() - self.start
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.stage.profile = _top(self.profiler)
+        self.run.stages.append(self.stage)
+
+        return False
+
+
+def _top(profiler, limit=PROFILE_TOP):
+    """Most expensive functions of a profile by cumulative time, as text lines."""
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(limit)
+
+    return [line for line in out.getvalue().splitlines() if line.strip()]
+
+
+class Run:
+    """Stages of one instrumented run."""
+
+    def __init__(self, name, profile=False):
+        self.name = name
+        self.profile = profile
+        self.started = dt.datetime.now()
+        self.start = time.perf_counter()
+        self.stages = []
+
+    def stage(self, name):
+        return _Timer(self, Stage(name))
+
+    def report(self):
+        return {
+            'name': self.name,
+            'started': self.started.isoformat(timespec='seconds'),
+            'wall': time.perf_counter() - self.start,
+            'rows': sum(stage.rows or 0 for stage in self.stages),
+            'bytes': sum(stage.bytes for stage in self.stages),
+            'stages': [stage.to_dict() for stage in self.stages],
+        }
+
+    def save(self, path=None):
+        """Write the JSON report, by default to data/runs/<name>_<start time>.json."""
+        path = path or os.path.join(RUNS_DIR, '{}_{}.json'.format(
+            self.name.replace('^', ''), self.started.strftime('%Y%m%dT%H%M%S')))
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=1)
+
+        return path
+
+    def print_summary(self):
+        for stage in self.stages:
+            print('{:<18} {:>8.3f}s {:>10} rows {:>12} bytes'.format(
+                stage.name, stage.seconds, stage.rows if stage.rows is not None else '-', stage.bytes))
+
+
+class _Off:
+    """Stand-in for Run when instrumentation is off."""
+
+    class _Stage:
+        # Accepts and drops the attributes instrumented code sets
+        rows = None
+        bytes = 0
+
+        def __setattr__(self, name, value):
+            pass
+
+        def wrote(self, *paths):
+            pass
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+    _stage = _Stage()
+
+    def stage(self, name):
+        return self._stage
+
+
+OFF = _Off()
@@ -10,15 +10,20 @@ This script generates various market analysis charts including:
 Usage:
     python main.py --symbol ^GSPC  # For S&P 500
     python main.py --symbol ^BVSP  # For Ibovespa
+    python main.py --universe ibrxa  # Every symbol of a symbols.py universe
+    python main.py --instrument      # Per-stage timings saved under data/runs
+    python main.py query ^GSPC       # Current drawdown from the local store
+    python main.py similar ^GSPC     # Past episodes of any stored symbol most like it
+    python main.py simulate ^GSPC    # Simulated days to recover from the current drawdown
+
+Heavy libraries (yfinance, matplotlib) are imported by the stages that
+use them, so --help and query start quickly.
 """
 
 import argparse
 import os
-import feeder_yahoo
-import process
-import cache
-import plot
-import market_analysis
+import instrument
+import symbols
 
 def create_directories():
     """Create necessary directories for data and images"""
@@ -26,25 +31,130 @@ def create_directories():
     os.makedirs('img', exist_ok=True)
     os.makedirs('data/ibov', exist_ok=True)
 
-def run_index_analysis(symbol):
-    """Run analysis for a specific market index"""
+def run_index_analysis(symbol, run=instrument.OFF):
+    """Run analysis for a specific market index, timing each stage in run"""
+    import cache
+    import export
+    import feeder_yahoo
+    import process
+    import render
+    import store
+
     print(f"\n=== Running analysis for {symbol} ===\n")
     
     # Get data
-    data = feeder_yahoo.get_data(symbol)
+    with run.stage('fetch') as stage:
+        data = feeder_yahoo.get_data(symbol)
+        stage.rows = len(data)
+        # Every fetch rewrites the symbol's store file and the store index
+        stage.wrote(store._symbol_path(symbol), store._index_path())
     print(data.tail())
     
     # Process crashes
-    crashes = process.crashes(data)
-    cache.save_crashes(crashes, symbol)
-    plot.crashes(crashes, symbol, save=True)
+    with run.stage('compute.crashes') as stage:
+        crashes = process.crashes(data)
+        stage.rows = len(crashes)
+    with run.stage('cache.crashes') as stage:
+        stage.wrote(*cache.save_crashes(crashes, symbol))
+    with run.stage('render.crashes') as stage:
+        path, rendered = render.render_chart('crashes', crashes, symbol)
+        stage.wrote(path if rendered else None)
+    with run.stage('export.crashes') as stage:
+        stage.wrote(export.export_chart('crashes', crashes, symbol))
     
     # Process recovery
-    recover = process.recover(data)
-    plot.recover(recover, symbol, save=True)
+    with run.stage('compute.recover') as stage:
+        recover = process.recover(data)
+        stage.rows = len(recover)
+    with run.stage('render.recover') as stage:
+        path, rendered = render.render_chart('recover', recover, symbol)
+        stage.wrote(path if rendered else None)
+    with run.stage('export.recover') as stage:
+        stage.wrote(export.export_chart('recover', recover, symbol))
     
     print(f"\n=== Analysis complete for {symbol} ===\n")
 
+def read_symbols_file(path):
+    """Read one symbol per line, ignoring blank lines and # comments"""
+    with open(path) as f:
+        lines = (line.split('#')[0].strip() for line in f)
+        return [line for line in lines if line]
+
+def run_pipeline(symbol_list, workers, queue_size):
+    """Run the analysis for many symbols with the multi-process pipeline"""
+    import pipeline
+
+    print(f"\n=== Running pipeline for {len(symbol_list)} symbols ===\n")
+    report = pipeline.run(symbol_list, workers=workers, queue_size=queue_size)
+    pipeline.print_report(report)
+
+def run_query(symbol):
+    """Print the current drawdown of symbol from the local price store"""
+    import store
+    import streaming
+
+    data = store.read(symbol)
+    if data is None or len(data) == 0:
+        print(f"No stored prices for {symbol}, run: python main.py --symbol {symbol}")
+        return
+
+    tracker = streaming.DrawdownTracker.from_history(symbol, data)
+    last = data['value'].iloc[-1]
+    print(f"{symbol} on {tracker.last_d:%Y-%m-%d}: {last:.2f}")
+    print(f"Peak on {tracker.peak_d:%Y-%m-%d}: {tracker.peak:.2f}")
+    print(f"Drawdown: {last / tracker.peak - 1:.1%} ({tracker.days} trading days since the peak)")
+    print(f"Deepest since the peak, on {tracker.trough_d:%Y-%m-%d}: {tracker.drawdown:.1%}")
+
+def run_similar(symbol, k, rebuild):
+    """Print the stored episodes whose first days look most like the current drawdown of symbol"""
+    import pandas as pd
+    import similarity
+    import store
+
+    data = store.read(symbol)
+    if data is None or len(data) == 0:
+        print(f"No stored prices for {symbol}, run: python main.py --symbol {symbol}")
+        return
+
+    # The whole open episode, for the current state; the match uses its start
+    episode = similarity.trajectory(data, length=len(data))
+    if len(episode) < 2:
+        print(f"{symbol} is at its all-time high")
+        return
+
+    index = similarity.build() if rebuild else similarity.load()
+    current = episode[:index.trajectories.shape[1]]
+    print(f"{symbol}: {episode[-1]:.1%} after {len(episode) - 1} days from the peak")
+    print(f"Matching its first {len(current)} days against {len(index)} episodes")
+    with pd.option_context('display.width', 200):
+        print(index.query(current, k, symbol).to_string(index=False))
+
+def run_simulate(symbol, paths, workers, seed, chart):
+    """Print the simulated days to recover from the current drawdown of symbol, optionally as a chart"""
+    import montecarlo
+    import store
+
+    data = store.read(symbol)
+    if data is None or len(data) == 0:
+        print(f"No stored prices for {symbol}, run: python main.py --symbol {symbol}")
+        return
+
+    result = montecarlo.simulate(data, paths, seed=seed, workers=workers)
+    summary = montecarlo.summary(result)
+    print(f"{symbol}: drawdown {summary['drawdown']:.1%}, {summary['paths']:,} simulated paths (seed {seed})")
+    for q, days in summary['days'].items():
+        print(f"  {q:.0%} of paths recover within {days if days is not None else 'more than ' + str(result['horizon'])} days")
+    for years, share in summary['recovered_within'].items():
+        print(f"  Recovered within {years} years: {share:.1%}")
+
+    if chart:
+        import matplotlib
+        matplotlib.use('Agg')
+        import plot
+        import process
+
+        plot.recover(process.recover(data), symbol, save=True, simulation=result)
+
 def main():
     """Main entry point"""
     parser = argparse.ArgumentParser(description='Financial Market Analysis Tool')
@@ -52,19 +162,76 @@ def main():
                         help='Market symbol to analyze (default: ^GSPC for S&P 500)')
     parser.add_argument('--simple', action='store_true',
                         help='Run the simple market analysis visualization')
+    parser.add_argument('--universe', choices=sorted(symbols.universes),
+                        help='Analyze every symbol of a universe from symbols.py')
+    parser.add_argument('--symbols-file', type=str,
+                        help='Analyze the symbols listed in a file, one per line')
+    parser.add_argument('--workers', type=int, default=2,
+                        help='Processes per compute and render stage (default: 2)')
+    parser.add_argument('--queue-size', type=int, default=4,
+                        help='Maximum symbols waiting between stages (default: 4)')
+    parser.add_argument('--instrument', action='store_true',
+                        help='Time each stage and save a JSON report under data/runs')
+    parser.add_argument('--profile', action='store_true',
+                        help='Like --instrument, with a cProfile summary of each stage')
+    commands = parser.add_subparsers(dest='command')
+    query = commands.add_parser('query', help='Print the current drawdown of a symbol from the local '
+                                              'store, without downloading or plotting')
+    query.add_argument('symbol', nargs='?', default='^GSPC',
+                       help='Symbol to query (default: ^GSPC)')
+    similar = commands.add_parser('similar', help='List the past episodes of every stored symbol whose '
+                                                  'first days are closest to the current drawdown')
+    similar.add_argument('symbol', nargs='?', default='^GSPC',
+                         help='Symbol whose current drawdown is matched (default: ^GSPC)')
+    similar.add_argument('-k', type=int, default=10, help='Episodes to list (default: 10)')
+    similar.add_argument('--rebuild', action='store_true',
+                         help='Rebuild the episode index even if the store did not change')
+    simulate = commands.add_parser('simulate', help='Estimate the days to recover from the current '
+                                                    'drawdown by bootstrapping stored daily returns')
+    simulate.add_argument('symbol', nargs='?', default='^GSPC',
+                          help='Symbol to simulate (default: ^GSPC)')
+    simulate.add_argument('--paths', type=int, default=100_000,
+                          help='Simulated paths (default: 100000)')
+    simulate.add_argument('--workers', type=int, default=1,
+                          help='Processes to spread the paths over (default: 1)')
+    simulate.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+    simulate.add_argument('--chart', action='store_true',
+                          help='Draw the simulated fan on the recovery chart')
     
     args = parser.parse_args()
     
+    if args.command == 'query':
+        run_query(args.symbol)
+        return
+    if args.command == 'similar':
+        run_similar(args.symbol, args.k, args.rebuild)
+        return
+    if args.command == 'simulate':
+        run_simulate(args.symbol, args.paths, args.workers, args.seed, args.chart)
+        return
+    
     # Create necessary directories
     create_directories()
     
     if args.simple:
         # Run the simple market analysis with modern styling
         print("\n=== Running simple market analysis ===\n")
+        # Imported here since it silences all warnings when loaded
+        import market_analysis
         market_analysis.create_sp500_chart()
+    elif args.universe or args.symbols_file:
+        symbol_list = symbols.universes[args.universe] if args.universe \
+            else read_symbols_file(args.symbols_file)
+        run_pipeline(symbol_list, args.workers, args.queue_size)
     else:
         # Run the detailed index analysis
-        run_index_analysis(args.symbol)
+        if args.instrument or args.profile:
+            run = instrument.Run(args.symbol, profile=args.profile)
+            run_index_analysis(args.symbol, run)
+            run.print_summary()
+            print(f"Run report saved to {run.save()}")
+        else:
+            run_index_analysis(args.symbol)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,32 +1,24 @@
-import feeder_yahoo
-import process
+import calendars
+import fetcher
+import panel
 import plot
-import cache
 import symbols
 import datetime as dt
-import pandas as pd
 
 
 def cache_symbols(symbols):
-    for symbol in symbols:
-        if not cache.check_equity_data_availability(symbol):
-            print(symbol)
-            #symbol = '{}.SA'.format(symbol)
-            data = feeder_yahoo.get_data(symbol, dt.datetime(2020, 2, 19))
-            symbol = symbol.replace('.SA', '')
-            df = process.crash_2020(data)
-            cache.save_ibov_equity(df, symbol)
+    report = fetcher.fetch_universe(symbols, dt.datetime(2020, 2, 19))
+    for symbol, error in report['failed'].items():
+        print('Failed to fetch {}: {}'.format(symbol, error))
 
 
 def load_symbols(symbols):
-    falls = pd.DataFrame()
-    for symbol in symbols:
-        df = cache.load_equity_data(symbol)
-        df['symbol'] = symbol
-        df = df[['symbol', 'd', 'cumdelta']]
-        falls = pd.concat([falls, df])
-
-    falls = falls.reset_index(drop=True).sort_values(['symbol', 'd'])
+    equities = panel.load(symbols)
+    # Symbols that failed to fetch have no cache and are not in the panel
+    symbols = [symbol for symbol in symbols if symbol in equities]
+    # B3 and US tickers trade on different days, put them on one calendar
+    aligned = calendars.align(equities.long(symbols), column=equities.column)
+    falls = aligned.long().sort_values(['symbol', 'd'])
 
     return falls
 
@@ -0,0 +1,162 @@
+"""
+Content-addressed, disk-backed memoization.
+
+Results are pickled under data/memo, keyed on a hash of the function
+name, its version and the contents of its arguments, so an identical
+input series skips the computation entirely. Reading a result refreshes
+its modification time and the directory is trimmed to MAX_BYTES by
+evicting the least recently used entries.
+"""
+
+import functools
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+MEMO_DIR = 'data/memo'
+MAX_BYTES = 256 * 1024 * 1024
+
+# Set to False to always recompute
+enabled = True
+
+log = logging.getLogger(__name__)
+
+
+def _hash_value(digest, value):
+    if isinstance(value, pd.DataFrame):
+        digest.update(repr(('DataFrame', list(value.columns), [str(t) for t in value.dtypes])).encode())
+        digest.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+    elif isinstance(value, pd.Series):
+        digest.update(repr(('Series', value.name, str(value.dtype))).encode())
+        digest.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+    elif isinstance(value, np.ndarray):
+        digest.update(repr((value.dtype.str, value.shape)).encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, (list, tuple)):
+        digest.update(repr((type(value).__name__, len(value))).encode())
+        for item in value:
+            _hash_value(digest, item)
+    elif isinstance(value, dict):
+        digest.update(repr(('dict', sorted(value, key=repr))).encode())
+        for name in sorted(value, key=repr):
+            _hash_value(digest, value[name])
+    elif hasattr(value, '__dict__') or hasattr(value, '__slots__'):
+        # Plain objects such as panel.Panel are hashed by their attributes
+        names = getattr(value, '__slots__', None) or sorted(vars(value))
+        digest.update(type(value).__qualname__.encode())
+        _hash_value(digest, {name: getattr(value, name) for name in names})
+    else:
+        digest.update(repr(value).encode())
+
+
+def key(name, version, args, kwargs):
+    """Hex digest identifying a call of function name at version with these arguments."""
+    digest = hashlib.sha256('{}|{}'.format(name, version).encode())
+    for arg in args:
+        _hash_value(digest, arg)
+    for name, value in sorted(kwargs.items()):
+        digest.update(name.encode())
+        _hash_value(digest, value)
+
+    return digest.hexdigest()
+
+
+def _load(path):
+    try:
+        with open(path, 'rb') as f:
+            result = pickle.load(f)
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+        return False, None
+    # Mark as recently used for the eviction order; another process may
+    # have evicted it since it was read
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+
+    return True, result
+
+
+def _save(path, result):
+    """Write result to path, logging instead of raising when the write fails."""
+    tmp = None
+    try:
+        os.makedirs(MEMO_DIR, exist_ok=True)
+        # One temp file per call: threads of a process may save the same key at once
+        fd, tmp = tempfile.mkstemp(dir=MEMO_DIR, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    except (OSError, pickle.PicklingError) as e:
+        log.warning('Could not write memo entry %s: %s', path, e)
+        if tmp is not None and os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def evict(max_bytes=None):
+    """Delete least recently used entries until the cache fits in max_bytes."""
+    max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+    try:
+        entries = [entry for entry in os.scandir(MEMO_DIR) if entry.name.endswith('.pkl')]
+    except FileNotFoundError:
+        return
+    stats = []
+    for entry in entries:
+        # Entries deleted by another process or thread meanwhile are skipped
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        stats.append((stat.st_mtime, stat.st_size, entry.path))
+    stats.sort(reverse=True)
+
+    total = 0
+    for _, size, path in stats:
+        total += size
+        if total > max_bytes:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def clear():
+    evict(0)
+
+
+def memoize(version=1):
+    """
+    Decorator caching a function's result on disk by the content of its arguments.
+
+    Bump version whenever the function's output changes for the same input.
+    The undecorated function stays available as .uncached.
+    """
+    def decorator(func):
+        name = '{}.{}'.format(func.__module__, func.__qualname__)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+
+            path = os.path.join(MEMO_DIR, '{}.pkl'.format(key(name, version, args, kwargs)))
+            found, result = _load(path)
+            if found:
+                return result
+
+            result = func(*args, **kwargs)
+            _save(path, result)
+            evict()
+
+            return result
+
+        wrapper.uncached = func
+
+        return wrapper
+
+    return decorator
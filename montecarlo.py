@@ -0,0 +1,136 @@
+"""
+Monte Carlo estimate of the time to recover from the current drawdown.
+
+Paths are built by block bootstrap: blocks of BLOCK consecutive daily log
+returns are drawn at random from the whole history of the series, which
+keeps the volatility clustering a day-by-day draw would lose. A chunk of
+paths is one gather from the prefix sums of the log returns, so every
+day of every path costs an index and an add. Chunks are bounded to
+CHUNK_CELLS path-days and can run on a process pool. Each chunk gets its
+own child of the seed, so results only depend on seed, not on workers.
+
+    result = montecarlo.simulate(store.read('^GSPC'), paths=200_000, workers=4)
+    montecarlo.summary(result)
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import process
+import returns
+
+# Trading days simulated per path; paths not back at the peak by then
+# count as not recovered
+HORIZON = 10 * returns.TRADING_DAYS
+# Days per bootstrap block
+BLOCK = 20
+# Path-days per chunk, 32 MB per float64 array
+CHUNK_CELLS = 1 << 22
+# Paths the fan quantiles are taken from, and the days they cover
+FAN_PATHS = 20_000
+FAN_DAYS = returns.TRADING_DAYS
+FAN_QUANTILES = (.05, .25, .5, .75, .95)
+
+
+def _chunk(job):
+    """Days to recover (-1 if never) of n paths, and their first fan_days levels."""
+    prefix, target, seed, n, horizon, block, fan_days = job
+    rng = np.random.default_rng(seed)
+    blocks = -(-horizon // block)
+    starts = rng.integers(0, len(prefix) - block, size=(n, blocks))
+
+    # Log level after day k of block j: sum of the earlier blocks plus the
+    # first k + 1 returns of block j, all differences of prefix sums
+    sums = prefix[starts + block] - prefix[starts]
+    before = np.cumsum(sums, axis=1) - sums - prefix[starts]
+    levels = before[:, :, None] + prefix[starts[:, :, None] + np.arange(1, block + 1)]
+    levels = levels.reshape(n, -1)[:, :horizon]
+
+    hit = levels >= target
+    days = np.where(hit.any(axis=1), hit.argmax(axis=1) + 1, -1).astype(np.int32)
+    if target <= 0:
+        # Already at the peak
+        days[:] = 0
+    fan = levels[:, :fan_days].astype(np.float32) if fan_days else None
+
+    return days, fan
+
+
+def current(raw_data):
+    """
+    State of the open episode of a (d, value) series: peak, bottom, last
+    value and days since the bottom (the ord_d of process.recover()).
+    """
+    values = process._frame(raw_data, copy=False)['value'].to_numpy(np.float64)
+    ep = process.episodes(values)
+
+    return {
+        'peak': ep['cummax'][-1],
+        'bottom': ep['ep_min'][-1],
+        'last': values[-1],
+        'ord_d': len(values) - 1 - ep['ep_trough'][-1],
+    }
+
+
+def simulate(raw_data, paths=100_000, horizon=HORIZON, block=BLOCK, seed=0, workers=None):
+    """
+    Simulate paths from the last value of a (d, value) series with its
+    bootstrapped returns and return a dict with the current() state, days
+    (days to get back to the peak per path, -1 if not within horizon) and
+    fan: FAN_QUANTILES of the recovery from the bottom, as in
+    process.recover(), on each of the next FAN_DAYS days.
+    """
+    values = process._frame(raw_data, copy=False)['value'].to_numpy(np.float64)
+    state = current(raw_data)
+    log_returns = np.diff(np.log(values))
+    log_returns = log_returns[np.isfinite(log_returns)]
+    if len(log_returns) <= block:
+        raise ValueError('Need more than {} returns to draw blocks from'.format(block))
+    prefix = np.r_[0, np.cumsum(log_returns)]
+    target = np.log(state['peak'] / state['last'])
+
+    chunk = max(1, CHUNK_CELLS // horizon)
+    sizes = [min(chunk, paths - i) for i in range(0, paths, chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    fan_days = min(FAN_DAYS, horizon)
+    jobs = [(prefix, target, child, n, horizon, block, fan_days if i * chunk < FAN_PATHS else 0)
+            for i, (n, child) in enumerate(zip(sizes, seeds))]
+
+    if workers and workers > 1:
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(workers, mp_context=context) as executor:
+            results = list(executor.map(_chunk, jobs))
+    else:
+        results = [_chunk(job) for job in jobs]
+
+    days = np.concatenate([days for days, _ in results])
+    levels = np.concatenate([fan for _, fan in results if fan is not None])[:FAN_PATHS]
+    recovery = state['last'] / state['bottom'] * np.exp(np.quantile(levels, FAN_QUANTILES, axis=0)) - 1
+
+    return dict(state, days=days, horizon=horizon, block=block, seed=seed, fan={
+        'ord_d': state['ord_d'] + np.arange(1, fan_days + 1),
+        'quantiles': FAN_QUANTILES,
+        'recovery': recovery,
+        'target': state['peak'] / state['bottom'] - 1,
+    })
+
+
+def summary(result, quantiles=(.1, .25, .5, .75, .9)):
+    """
+    Days-to-recover quantiles of a simulate() result, None where the
+    quantile is beyond the horizon, and the share of paths recovered within
+    1, 2, 5 and horizon / TRADING_DAYS years.
+    """
+    days = np.where(result['days'] < 0, result['horizon'] + 1, result['days'])
+    at = np.quantile(days, quantiles, method='inverted_cdf')
+    years = sorted({1, 2, 5, result['horizon'] // returns.TRADING_DAYS})
+
+    return {
+        'drawdown': result['last'] / result['peak'] - 1,
+        'paths': len(days),
+        'days': {q: int(d) if d <= result['horizon'] else None for q, d in zip(quantiles, at)},
+        'recovered_within': {y: float(np.mean(days <= y * returns.TRADING_DAYS))
+                             for y in years if y * returns.TRADING_DAYS <= result['horizon']},
+    }
@@ -0,0 +1,147 @@
+"""
+Memory-mapped, date-aligned panel of the equity cache.
+
+The panel is a (dates x symbols) float64 array saved as .npy next to the
+date axis and the symbol index. It is stored in Fortran (column) order, so
+each symbol's history is contiguous on disk. It is built once from
+data/ibov and then opened with mmap_mode='r', so reading a few symbols or
+a date range only touches those pages. load() rebuilds it when a cached
+equity changed after it was built.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import cache
+
+PANEL_DIR = 'data/panel'
+
+
+def _panel_path(name):
+    return os.path.join(PANEL_DIR, name)
+
+
+class Panel:
+    def __init__(self, dates, symbols, values, column='cumdelta'):
+        self.dates = dates
+        self.column = column
+        self.symbols = list(symbols)
+        self.values = values
+        self._columns = {symbol: i for i, symbol in enumerate(self.symbols)}
+
+    def __contains__(self, symbol):
+        return symbol in self._columns
+
+    def _rows(self, start=None, end=None):
+        lo = 0 if start is None else np.searchsorted(self.dates, np.datetime64(start, 'D'), 'left')
+        hi = len(self.dates) if end is None else np.searchsorted(self.dates, np.datetime64(end, 'D'), 'right')
+
+        return slice(lo, hi)
+
+    def slice(self, symbols=None, start=None, end=None):
+        """Return a wide frame (index d, one column per symbol), copying only the slice."""
+        symbols = self.symbols if symbols is None else list(symbols)
+        rows = self._rows(start, end)
+        cols = [self._columns[symbol] for symbol in symbols]
+        # The row slice is a view; each selected column is then read as one
+        # contiguous run of the column-major memmap
+        values = np.asarray(self.values[rows][:, cols])
+
+        return pd.DataFrame(values, index=pd.DatetimeIndex(self.dates[rows], name='d'), columns=symbols)
+
+    def long(self, symbols=None, start=None, end=None):
+        """Return the slice in long format (symbol, d, <column>) without missing rows."""
+        value_name = self.column
+        wide = self.slice(symbols, start, end)
+        data = wide.melt(ignore_index=False, var_name='symbol', value_name=value_name)
+        data = data.dropna(subset=[value_name]).reset_index()
+
+        return data[['symbol', 'd', value_name]]
+
+
+def build(symbols=None, column='cumdelta', name='equity'):
+    """Build the panel for symbols (default: every cached equity) and open it."""
+    symbols = cache.list_equities() if symbols is None else list(symbols)
+
+    # First pass only reads the date columns to size the common axis
+    symbol_dates = [cache.load_equity_data(symbol, ['d'])['d'].to_numpy('datetime64[D]')
+                    for symbol in symbols]
+    dates = np.unique(np.concatenate(symbol_dates)) if symbols else np.array([], 'datetime64[D]')
+
+    path = _panel_path(name)
+    os.makedirs(path, exist_ok=True)
+    # Panels opened earlier keep mapping the old files, so each file is
+    # written to a temp path and replaced instead of rewritten in place
+    tmp = {f: os.path.join(path, '{}.{}.tmp'.format(f, os.getpid()))
+           for f in ('values.npy', 'dates.npy', 'symbols.json')}
+    values = np.lib.format.open_memmap(tmp['values.npy'], mode='w+',
+                                       dtype=np.float64, shape=(len(dates), len(symbols)),
+                                       fortran_order=True)
+    values[:] = np.nan
+    for i, symbol in enumerate(symbols):
+        df = cache.load_equity_data(symbol, ['d', column])
+        values[np.searchsorted(dates, symbol_dates[i]), i] = df[column].to_numpy(np.float64)
+    values.flush()
+    del values
+
+    with open(tmp['dates.npy'], 'wb') as f:
+        np.save(f, dates)
+    with open(tmp['symbols.json'], 'w') as f:
+        json.dump({'column': column, 'symbols': symbols}, f)
+    # symbols.json last: load() only looks for a panel once it exists
+    for f in ('values.npy', 'dates.npy', 'symbols.json'):
+        os.replace(tmp[f], os.path.join(path, f))
+
+    return open_panel(name)
+
+
+def open_panel(name='equity'):
+    """Open a built panel without reading its values into memory."""
+    path = _panel_path(name)
+    with open(os.path.join(path, 'symbols.json')) as f:
+        meta = json.load(f)
+    dates = np.load(os.path.join(path, 'dates.npy'))
+    values = np.load(os.path.join(path, 'values.npy'), mmap_mode='r')
+
+    return Panel(dates, meta['symbols'], values, meta['column'])
+
+
+def _stale(equities, name):
+    """
+    Whether the cached data of any symbol of the panel changed after it was
+    built: its file is newer, or it has bars past the panel's last date.
+    """
+    built = os.path.getmtime(os.path.join(_panel_path(name), 'values.npy'))
+    last = equities.dates[-1] if len(equities.dates) else None
+    for symbol in equities.symbols:
+        fmt = cache._equity_format(symbol)
+        if fmt is None:
+            continue
+        if os.path.getmtime(cache._equity_path(symbol, fmt)) > built:
+            return True
+        d = cache.load_equity_data(symbol, ['d'])['d'].to_numpy('datetime64[D]')
+        if len(d) and (last is None or d[-1] > last):
+            return True
+
+    return False
+
+
+def load(symbols, column='cumdelta', name='equity'):
+    """
+    Open the panel, rebuilding it from the cache if any of symbols is missing
+    or the cached data of its symbols was updated after it was built.
+
+    Symbols with no cached data, such as failed fetches, are left out.
+    """
+    symbols = [symbol for symbol in symbols if cache._equity_format(symbol) is not None]
+    if os.path.exists(os.path.join(_panel_path(name), 'symbols.json')):
+        equities = open_panel(name)
+        # Panels from before the column-major layout are rebuilt once
+        if equities.column == column and equities.values.flags.f_contiguous and \
+                all(symbol in equities for symbol in symbols) and not _stale(equities, name):
+            return equities
+
+    return build(sorted(set(cache.list_equities()) | set(symbols)), column, name)
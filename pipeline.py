@@ -0,0 +1,162 @@
+"""
+Pipeline runner for the index analysis over many symbols.
+
+Fetching runs on a thread pool (it waits on the network), computing and
+rendering on two separate process pools. Bounded queues connect the
+stages, so when rendering falls behind the earlier stages block instead
+of piling up frames in memory.
+"""
+
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+import cache
+import feeder_yahoo
+import process
+import render
+
+STAGES = ('fetch', 'compute', 'render')
+
+_DONE = None
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+
+    return result, time.perf_counter() - start
+
+
+def compute(symbol, data):
+    crashes = process.crashes(data)
+    cache.save_crashes(crashes, symbol)
+    recover = process.recover(data)
+
+    return symbol, crashes, recover
+
+
+def draw(symbol, crashes, recover):
+    render.render_chart('crashes', crashes, symbol)
+    render.render_chart('recover', recover, symbol)
+
+    return symbol
+
+
+def _forward(stage, inbox, outbox, submit, report):
+    """Wait for each result of the previous stage and hand it to the next one."""
+    try:
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                return
+            symbol, prev_stage, future = item
+            try:
+                result, seconds = future.result()
+            except Exception as e:
+                report['failed'][symbol] = '{}: {!r}'.format(prev_stage, e)
+                continue
+            report['timings'][prev_stage].append(seconds)
+            # A broken or shut down pool fails this symbol, not the thread
+            try:
+                outbox.put((symbol, stage, submit(result)))
+            except Exception as e:
+                report['failed'][symbol] = '{}: {!r}'.format(stage, e)
+    finally:
+        # run() waits for _DONE, so it is sent whatever happens above
+        outbox.put(_DONE)
+
+
+def _summary(seconds):
+    if not seconds:
+        return {'count': 0, 'total': 0.0, 'mean': 0.0, 'max': 0.0}
+
+    return {
+        'count': len(seconds),
+        'total': sum(seconds),
+        'mean': sum(seconds) / len(seconds),
+        'max': max(seconds),
+    }
+
+
+def run(symbols, fetch=feeder_yahoo.get_series, fetch_workers=4, workers=2,
+        queue_size=4, render_charts=True):
+    """
+    Fetch, compute and render every symbol, overlapping the three stages.
+
+    fetch(symbol) must return a frame with 'd' and 'value' columns or a
+    prices.PriceSeries, which is cheaper to send to the compute workers,
+    and may be a stub. Returns a report with the symbols done, the
+    failures as {symbol: 'stage: error'} and per-stage timings in seconds.
+    """
+    report = {'done': [], 'failed': {}, 'timings': {stage: [] for stage in STAGES}}
+    started = time.perf_counter()
+
+    # Spawned workers start clean, without the threads running in this process
+    context = multiprocessing.get_context('spawn')
+    fetched = queue.Queue(queue_size)
+    computed = queue.Queue(queue_size)
+    rendered = queue.Queue(queue_size)
+
+    with ThreadPoolExecutor(fetch_workers) as fetch_pool, \
+            ProcessPoolExecutor(workers, mp_context=context) as compute_pool, \
+            ProcessPoolExecutor(workers, mp_context=context) as render_pool:
+
+        def submit_compute(data):
+            symbol, frame = data
+            return compute_pool.submit(_timed, compute, symbol, frame)
+
+        def submit_render(result):
+            if render_charts:
+                return render_pool.submit(_timed, draw, *result)
+            skipped = Future()
+            skipped.set_result((result[0], 0.0))
+            return skipped
+
+        def produce():
+            for symbol in symbols:
+                fetched.put((symbol, 'fetch',
+                             fetch_pool.submit(_timed, lambda s: (s, fetch(s)), symbol)))
+            fetched.put(_DONE)
+
+        threads = [
+            threading.Thread(target=produce),
+            threading.Thread(target=_forward,
+                             args=('compute', fetched, computed, submit_compute, report)),
+            threading.Thread(target=_forward,
+                             args=('render', computed, rendered, submit_render, report)),
+        ]
+        for thread in threads:
+            thread.start()
+
+        while True:
+            item = rendered.get()
+            if item is _DONE:
+                break
+            symbol, stage, future = item
+            try:
+                _, seconds = future.result()
+                report['timings'][stage].append(seconds)
+                report['done'].append(symbol)
+            except Exception as e:
+                report['failed'][symbol] = '{}: {!r}'.format(stage, e)
+
+        for thread in threads:
+            thread.join()
+
+    report['timings'] = {stage: _summary(seconds) for stage, seconds in report['timings'].items()}
+    report['wall'] = time.perf_counter() - started
+
+    return report
+
+
+def print_report(report):
+    print(f"\n=== Pipeline finished in {report['wall']:.1f}s: "
+          f"{len(report['done'])} done, {len(report['failed'])} failed ===\n")
+    for stage, stats in report['timings'].items():
+        print(f"{stage:>8}: {stats['count']:4d} runs, total {stats['total']:7.2f}s, "
+              f"mean {stats['mean']:6.3f}s, max {stats['max']:6.3f}s")
+    for symbol, error in report['failed'].items():
+        print(f"Failed {symbol}: {error}")
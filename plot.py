@@ -1,11 +1,28 @@
 import matplotlib.pyplot as plt
 import matplotlib.ticker as mtick
-import datetime as dt
+import os
 import numpy as np
 import seaborn as sns
 
-def crashes(data, symbol, save=False):
-    """Create an enhanced, more visually appealing chart of market crashes."""
+import process
+
+
+CHART_IDS = {'^BVSP': 'ibov', '^GSPC': 'sp500'}
+CHART_FILES = {'crashes': 'crash', 'recover': 'recovery', 'fan': 'recovery_fan'}
+
+
+def chart_id(symbol):
+    """File name id of the charts for symbol."""
+    return CHART_IDS.get(symbol, symbol.replace('^', '').replace('.SA', '').lower())
+
+
+def chart_path(kind, symbol, img_dir='img'):
+    """Output path of the 'crashes' or 'recover' chart for symbol."""
+    return os.path.join(img_dir, '{}_{}.png'.format(CHART_FILES[kind], chart_id(symbol)))
+
+
+def crashes(data, symbol, save=False, img_dir='img'):
+    """Create an enhanced, more visually appealing chart of market crashes, saved under img_dir."""
     
     # Chart text and styling configuration
     strs = {
@@ -24,6 +41,12 @@ def crashes(data, symbol, save=False):
             'id': 'sp500'
         }
     }
+    strs.setdefault(symbol, {
+        'title': '{}: Historical Drawdowns'.format(symbol),
+        'subtitle': 'Comparing current sell-off with past drawdowns',
+        'xlabel': 'Trading days since peak',
+        'note': 'Updated: {}'
+    })
 
     # Set up improved color palette
     current_color = '#E6550D'    # Bright orange for current crash
@@ -39,116 +62,108 @@ def crashes(data, symbol, save=False):
     
     # Find all-time high and worst crash
     ath = data['value'].max()
-    all_crashes = []
-    
-    # Collect data about each crash for better labeling
-    for x in data['cummax'].unique():
-        sub = data[data['cummax'] == x]
-        if sub['delta'].min() < -.02:  # Only include actual drawdowns
-            crash_year = str(sub['d'].values[0])[:4]
-            min_value = sub['delta'].min()
-            all_crashes.append((x, crash_year, min_value))
-    
-    # Sort crashes by severity
-    all_crashes.sort(key=lambda x: x[2])
+    summary, lines = process.episode_summary(data, 'delta')
+    # Only include actual drawdowns, sorted by severity
+    drawdowns = summary[summary['min'] < -.02]
+    all_crashes = drawdowns.sort_values('min', kind='stable')
     
     # Identify current, worst, and notable crashes
-    worst_crash = all_crashes[0][0] if all_crashes else None
+    worst_crash = all_crashes['cummax'].iloc[0] if len(all_crashes) else None
     current_crash = ath
     
     # Find 2-3 notable historical crashes (not current, not worst)
     notable_crashes = []
-    for x, year, value in all_crashes[1:7]:  # Take 2nd-7th worst crashes
-        if x != current_crash and value < -0.25:  # Only if severe enough
-            notable_crashes.append(x)
+    for crash in all_crashes.iloc[1:7].itertuples():  # Take 2nd-7th worst crashes
+        if crash.cummax != current_crash and crash.min < -0.25:  # Only if severe enough
+            notable_crashes.append(crash.cummax)
     
     # Plot all crashes with appropriate styling
-    for x in data['cummax'].unique():
-        sub = data[data['cummax'] == x]
-        if sub['delta'].min() < -.02:
-            # Determine appropriate styling for this crash
+    for crash in drawdowns.itertuples():
+        x = crash.cummax
+        ord_d, delta = lines[crash.Index]
+        # Determine appropriate styling for this crash
+        if x == current_crash:
+            color = current_color
+            alpha = 1.0
+            linewidth = 3.0
+            zorder = 10
+            marker_size = 80
+        elif x == worst_crash:
+            color = worst_color
+            alpha = 0.9
+            linewidth = 2.5
+            zorder = 9
+            marker_size = 60
+        elif x in notable_crashes:
+            color = notable_color
+            alpha = 0.8
+            linewidth = 2.0
+            zorder = 8
+            marker_size = 30
+        else:
+            color = other_color
+            alpha = 0.4 + (crash.min * -1) * 0.5  # Scale opacity by severity
+            linewidth = 1.0
+            zorder = 5
+            marker_size = 20
+        
+        # Plot the crash line
+        ax.plot(ord_d, delta, 
+               color=color, 
+               alpha=alpha, 
+               linewidth=linewidth,
+               zorder=zorder,
+               solid_capstyle='round')
+        
+        # Add end marker
+        ax.scatter(crash.last_ord_d,
+                  crash.last,
+                  color=color,
+                  alpha=alpha,
+                  s=marker_size,
+                  zorder=zorder+1,
+                  marker='o',
+                  edgecolor='white')
+        
+        # Add labels for important crashes
+        if (x == current_crash or 
+            x == worst_crash or 
+            x in notable_crashes or 
+            crash.min < -0.35):
+            
+            year = crash.year
+            value = crash.last
+            
+            # Create nicer label
             if x == current_crash:
-                color = current_color
-                alpha = 1.0
-                linewidth = 3.0
-                zorder = 10
-                marker_size = 80
-            elif x == worst_crash:
-                color = worst_color
-                alpha = 0.9
-                linewidth = 2.5
-                zorder = 9
-                marker_size = 60
-            elif x in notable_crashes:
-                color = notable_color
-                alpha = 0.8
-                linewidth = 2.0
-                zorder = 8
-                marker_size = 30
+                label = f"Current ({year}): {value:.1%}"
             else:
-                color = other_color
-                alpha = 0.4 + (sub['delta'].min() * -1) * 0.5  # Scale opacity by severity
-                linewidth = 1.0
-                zorder = 5
-                marker_size = 20
+                label = f"{year}: {value:.1%}"
             
-            # Plot the crash line
-            ax.plot(sub['ord_d'], sub['delta'], 
-                   color=color, 
-                   alpha=alpha, 
-                   linewidth=linewidth,
-                   zorder=zorder,
-                   solid_capstyle='round')
-            
-            # Add end marker
-            ax.scatter(sub['ord_d'].max(),
-                      sub['delta'].values[-1],
-                      color=color,
-                      alpha=alpha,
-                      s=marker_size,
-                      zorder=zorder+1,
-                      marker='o',
-                      edgecolor='white')
+            # Determine text position
+            if year in ['2018', '2004', '1987', '2020', '2022']:
+                ha = 'left'
+                x_offset = 5
+            else:
+                ha = 'right'
+                x_offset = -5
             
-            # Add labels for important crashes
-            if (x == current_crash or 
-                x == worst_crash or 
-                x in notable_crashes or 
-                sub['delta'].min() < -0.35):
-                
-                year = str(sub['d'].values[0])[:4]
-                value = sub['delta'].values[-1]
-                
-                # Create nicer label
-                if x == current_crash:
-                    label = f"Current ({year}): {value:.1%}"
-                else:
-                    label = f"{year}: {value:.1%}"
-                
-                # Determine text position
-                if year in ['2018', '2004', '1987', '2020', '2022']:
-                    ha = 'left'
-                    x_offset = 5
-                else:
-                    ha = 'right'
-                    x_offset = -5
-                
-                # Add text label with slightly larger font
-                ax.text(sub['ord_d'].max() + x_offset,
-                       sub['delta'].values[-1],
-                       label,
-                       color=color,
-                       fontsize=10,
-                       fontweight='bold' if x == current_crash else 'normal',
-                       ha=ha,
-                       va='center',
-                       bbox=dict(
-                           boxstyle="round,pad=0.3", 
-                           fc='white', 
-                           ec=color if x == current_crash else 'none',
-                           alpha=0.8
-                       ))
-    
+            # Add text label with slightly larger font
+            ax.text(crash.last_ord_d + x_offset,
+                   crash.last,
+                   label,
+                   color=color,
+                   fontsize=10,
+                   fontweight='bold' if x == current_crash else 'normal',
+                   ha=ha,
+                   va='center',
+                   bbox=dict(
+                       boxstyle="round,pad=0.3", 
+                       fc='white', 
+                       ec=color if x == current_crash else 'none',
+                       alpha=0.8
+                   ))
+
     # Add horizontal lines for reference
     for level in [0, -0.1, -0.2, -0.3, -0.4, -0.5]:
         ax.axhline(
@@ -173,8 +188,7 @@ def crashes(data, symbol, save=False):
     # Improve chart styling
     
     # Set appropriate limits
-    min_y = min(sub['delta'].min() for x in data['cummax'].unique() 
-                if (sub := data[data['cummax'] == x])['delta'].min() < -0.02)
+    min_y = drawdowns['min'].min() if len(drawdowns) else 0
     ax.set_ylim(min(min_y * 1.1, -0.55), 0.05)  # Add some padding
     
     # Remove unnecessary spines
@@ -199,9 +213,9 @@ def crashes(data, symbol, save=False):
     ax.set_xlabel(strs[symbol]['xlabel'], fontsize=12)
     ax.set_ylabel('Drawdown from Peak', fontsize=12)
     
-    # Add a footnote
-    now = dt.datetime.today().strftime('%Y-%m-%d')
-    note_text = strs[symbol]['note'].format(now)
+    # Add a footnote, dated by the last bar so the chart only changes with the data
+    updated = data['d'].max().strftime('%Y-%m-%d')
+    note_text = strs[symbol]['note'].format(updated)
     fig.text(0.02, 0.02, note_text, ha='left', va='bottom', 
              fontsize=9, color='#666666')
     
@@ -220,12 +234,15 @@ def crashes(data, symbol, save=False):
     
     # Save or display the figure
     if save:
-        plt.savefig('img/crash_{}.png'.format(strs[symbol]['id']), 
+        plt.savefig(chart_path('crashes', symbol, img_dir), 
                    dpi=150, bbox_inches='tight', facecolor='#f8f9fa')
-        print(f"Enhanced crash chart saved to img/crash_{strs[symbol]['id']}.png")
+        print(f"Enhanced crash chart saved to {chart_path('crashes', symbol, img_dir)}")
     else:
         plt.show()
 
+    # Release the figure so batch runs don't accumulate open figures
+    plt.close(fig)
+
 
 def drawdown(data, symbol):
     fig, ax = plt.subplots(figsize=(10, 5))
@@ -253,8 +270,15 @@ def drawdown(data, symbol):
     plt.show()
 
 
-def recover(data, symbol, save=False):
-    """Create an enhanced chart showing market recovery patterns after bottoms."""
+def recover(data, symbol, save=False, simulation=None, img_dir='img'):
+    """
+    Create an enhanced chart showing market recovery patterns after bottoms,
+    saved under img_dir.
+
+    simulation, a montecarlo.simulate() result, adds a fan of its simulated
+    paths after the current recovery; the chart is then saved as the 'fan'
+    chart.
+    """
     
     # Chart text and styling configuration
     strs = {
@@ -275,6 +299,13 @@ def recover(data, symbol, save=False):
             'id': 'sp500'
         }
     }
+    strs.setdefault(symbol, {
+        'title': '{} Recovery Patterns'.format(symbol),
+        'subtitle': 'Market behavior after reaching bottoms',
+        'xlabel': 'Trading days since market bottom',
+        'ylabel': 'Recovery from bottom (%)',
+        'note': 'Updated: {}'
+    })
 
     # Enhanced color palette
     current_color = '#1f77b4'   # Blue for current recovery
@@ -293,24 +324,19 @@ def recover(data, symbol, save=False):
     all_recoveries = []
     
     # Process data to identify different types of recoveries
-    for x in data['cummax'].unique():
-        if 'min' not in data.columns:
-            continue
-            
-        sub = data[data['cummax'] == x]
-        # Apply the same filtering as in the original
-        sub_d = sub['ord_d'].max() if 'ord_d' in sub.columns else 0
-        
-        if 'ord_d' in sub.columns:
-            sub = sub[sub['ord_d'] >= -100]
-            sub = sub[sub['ord_d'] <= 100]
-        
-        if 'min' in sub.columns and sub['min'].min() < .98:
+    if 'min' in data.columns and 'ord_d' in data.columns and 'cumdelta' in data.columns:
+        # Days covered by each episode, then the window around its bottom
+        days = process.episode_summary(data, 'cumdelta')[0].set_index('cummax')['last_ord_d']
+        window = data[(data['ord_d'] >= -100) & (data['ord_d'] <= 100)]
+        summary, lines = process.episode_summary(window, 'cumdelta')
+        summary['drawdown'] = window['min'].to_numpy()[summary['start']]
+        summary = summary[summary['drawdown'] < .98]
+
+        for recovery in summary.itertuples():
             # Track recovery metrics
-            recovery_year = str(sub['d'].values[0])[:4]
-            recovery_max = sub['cumdelta'].max() if 'cumdelta' in sub.columns else 0
-            recovery_speed = recovery_max / (sub_d + 1) if sub_d > 0 else 0
-            all_recoveries.append((x, recovery_year, recovery_max, recovery_speed))
+            sub_d = days[recovery.cummax]
+            recovery_speed = recovery.max / (sub_d + 1) if sub_d > 0 else 0
+            all_recoveries.append((recovery.cummax, recovery.year, recovery.max, recovery_speed))
     
     # Sort recoveries by speed
     if all_recoveries:
@@ -322,105 +348,96 @@ def recover(data, symbol, save=False):
         slow_recoveries = [r[0] for r in all_recoveries[-3:] if r[0] != current_recovery]
     
         # Plot recoveries with appropriate styling
-        for x in data['cummax'].unique():
-            if 'min' not in data.columns:
-                continue
-                
-            sub = data[data['cummax'] == x]
-            if 'ord_d' in sub.columns:
-                sub_d = sub['ord_d'].max()
-                sub = sub[sub['ord_d'] >= -100]
-                sub = sub[sub['ord_d'] <= 100]
+        for recovery in summary.itertuples():
+            x = recovery.cummax
+            ord_d, cumdelta = lines[recovery.Index]
+            # Determine styling
+            if x == current_recovery:
+                color = current_color
+                alpha = 1.0
+                linewidth = 3.0
+                zorder = 10
+                marker_size = 80
+                label_size = 11
+                is_bold = True
+            elif x in fast_recoveries:
+                color = fast_color
+                alpha = 0.8
+                linewidth = 2.0
+                zorder = 8
+                marker_size = 60
+                label_size = 10
+                is_bold = False
+            elif x in slow_recoveries:
+                color = slow_color
+                alpha = 0.8
+                linewidth = 2.0
+                zorder = 8
+                marker_size = 60
+                label_size = 10
+                is_bold = False
+            else:
+                color = other_color
+                alpha = 0.3 + (1 - recovery.drawdown) * 0.5  # Opacity based on drawdown magnitude
+                linewidth = 1.0
+                zorder = 5
+                marker_size = 40
+                label_size = 9
+                is_bold = False
             
-            # Only proceed if we have the necessary columns and data meets criteria
-            if 'min' in sub.columns and 'cumdelta' in sub.columns and sub['min'].min() < .98:
-                # Determine styling
+            # Plot the recovery
+            ax.plot(ord_d, cumdelta,
+                   color=color,
+                   alpha=alpha,
+                   linewidth=linewidth,
+                   zorder=zorder,
+                   solid_capstyle='round')
+            
+            # Add end marker
+            ax.scatter(recovery.last_ord_d,
+                      recovery.last,
+                      color=color,
+                      alpha=alpha,
+                      s=marker_size,
+                      zorder=zorder+1,
+                      marker='o',
+                      edgecolor='white')
+            
+            # Add labels for notable recoveries
+            if (x == current_recovery or 
+                x in fast_recoveries or 
+                x in slow_recoveries or 
+                recovery.max > 0.5):  # Also label big recoveries
+                
+                year = recovery.year
+                value = recovery.last
+                
+                # Determine label content
                 if x == current_recovery:
-                    color = current_color
-                    alpha = 1.0
-                    linewidth = 3.0
-                    zorder = 10
-                    marker_size = 80
-                    label_size = 11
-                    is_bold = True
-                elif x in fast_recoveries:
-                    color = fast_color
-                    alpha = 0.8
-                    linewidth = 2.0
-                    zorder = 8
-                    marker_size = 60
-                    label_size = 10
-                    is_bold = False
-                elif x in slow_recoveries:
-                    color = slow_color
-                    alpha = 0.8
-                    linewidth = 2.0
-                    zorder = 8
-                    marker_size = 60
-                    label_size = 10
-                    is_bold = False
+                    label = f"Current ({year}): +{value:.1%}"
                 else:
-                    color = other_color
-                    alpha = 0.3 + (1 - sub['min'].min()) * 0.5  # Opacity based on drawdown magnitude
-                    linewidth = 1.0
-                    zorder = 5
-                    marker_size = 40
-                    label_size = 9
-                    is_bold = False
-                
-                # Plot the recovery
-                ax.plot(sub['ord_d'], sub['cumdelta'],
-                       color=color,
-                       alpha=alpha,
-                       linewidth=linewidth,
-                       zorder=zorder,
-                       solid_capstyle='round')
+                    label = f"{year}: +{value:.1%}"
                 
-                # Add end marker
-                ax.scatter(sub['ord_d'].max(),
-                          sub['cumdelta'].values[-1],
-                          color=color,
-                          alpha=alpha,
-                          s=marker_size,
-                          zorder=zorder+1,
-                          marker='o',
-                          edgecolor='white')
+                # Determine label position
+                ha = 'left' if year in ['2018'] else 'right'
+                x_offset = 5 if ha == 'left' else -5
                 
-                # Add labels for notable recoveries
-                if (x == current_recovery or 
-                    x in fast_recoveries or 
-                    x in slow_recoveries or 
-                    sub['cumdelta'].max() > 0.5):  # Also label big recoveries
-                    
-                    year = str(sub['d'].values[0])[:4]
-                    value = sub['cumdelta'].values[-1]
-                    
-                    # Determine label content
-                    if x == current_recovery:
-                        label = f"Current ({year}): +{value:.1%}"
-                    else:
-                        label = f"{year}: +{value:.1%}"
-                    
-                    # Determine label position
-                    ha = 'left' if year in ['2018'] else 'right'
-                    x_offset = 5 if ha == 'left' else -5
-                    
-                    # Add text label
-                    ax.text(sub['ord_d'].max() + x_offset,
-                           sub['cumdelta'].values[-1],
-                           label,
-                           color=color,
-                           fontsize=label_size,
-                           fontweight='bold' if is_bold else 'normal',
-                           ha=ha,
-                           va='center',
-                           bbox=dict(
-                               boxstyle="round,pad=0.3",
-                               fc='white',
-                               ec=color if x == current_recovery else 'none',
-                               alpha=0.8
-                           ))
-    
+                # Add text label
+                ax.text(recovery.last_ord_d + x_offset,
+                       recovery.last,
+                       label,
+                       color=color,
+                       fontsize=label_size,
+                       fontweight='bold' if is_bold else 'normal',
+                       ha=ha,
+                       va='center',
+                       bbox=dict(
+                           boxstyle="round,pad=0.3",
+                           fc='white',
+                           ec=color if x == current_recovery else 'none',
+                           alpha=0.8
+                       ))
+
     # Add horizontal reference lines
     for level in [0, 0.2, 0.4, 0.6, 0.8, 1.0]:
         ax.axhline(
@@ -451,6 +468,21 @@ def recover(data, symbol, save=False):
     # Set appropriate limits for x and y axes
     ax.set_xlim(-50, 100)
     ax.set_ylim(-0.05, 1.2)  # Allow some space for high recoveries
+
+    # Simulated paths from today: 5-95% and 25-75% bands and the median
+    if simulation is not None:
+        fan = simulation['fan']
+        bands = dict(zip(fan['quantiles'], fan['recovery']))
+        ax.fill_between(fan['ord_d'], bands[.05], bands[.95], color=current_color, alpha=0.12,
+                        linewidth=0, zorder=3)
+        ax.fill_between(fan['ord_d'], bands[.25], bands[.75], color=current_color, alpha=0.22,
+                        linewidth=0, zorder=3)
+        ax.plot(fan['ord_d'], bands[.5], color=current_color, linestyle='--', linewidth=1.5, zorder=9)
+        ax.axhline(y=fan['target'], color=current_color, linestyle=':', alpha=0.6, zorder=2)
+        ax.text(fan['ord_d'][-1], fan['target'], "Previous peak", ha='right', va='bottom',
+                fontsize=9, color=current_color)
+        ax.set_xlim(-50, max(100, fan['ord_d'][-1] + 5))
+        ax.set_ylim(-0.05, max(1.2, fan['target'] + 0.1))
     
     # Remove unnecessary spines
     for spine in ['top', 'right', 'left', 'bottom']:
@@ -474,9 +506,9 @@ def recover(data, symbol, save=False):
     ax.set_xlabel(strs[symbol]['xlabel'], fontsize=12)
     ax.set_ylabel(strs[symbol]['ylabel'], fontsize=12)
     
-    # Add a footnote
-    now = dt.datetime.today().strftime('%Y-%m-%d')
-    note_text = strs[symbol]['note'].format(now)
+    # Add a footnote, dated by the last bar so the chart only changes with the data
+    updated = data['d'].max().strftime('%Y-%m-%d')
+    note_text = strs[symbol]['note'].format(updated)
     fig.text(0.02, 0.02, note_text, ha='left', va='bottom',
              fontsize=9, color='#666666')
     
@@ -488,6 +520,13 @@ def recover(data, symbol, save=False):
         Line2D([0], [0], color=slow_color, lw=2, label='Slow Recoveries'),
         Line2D([0], [0], color=other_color, lw=1, alpha=0.7, label='Other Periods')
     ]
+    if simulation is not None:
+        from matplotlib.patches import Patch
+        legend_elements += [
+            Line2D([0], [0], color=current_color, lw=1.5, linestyle='--', label='Simulated Median'),
+            Patch(facecolor=current_color, alpha=0.3,
+                  label='Simulated 25-75% / 5-95% ({:,} paths)'.format(len(simulation['days']))),
+        ]
     ax.legend(handles=legend_elements, loc='upper right', frameon=True,
              fontsize=10, facecolor='white', framealpha=0.9)
     
@@ -495,12 +534,15 @@ def recover(data, symbol, save=False):
     
     # Save or display the figure
     if save:
-        plt.savefig('img/recovery_{}.png'.format(strs[symbol]['id']),
-                   dpi=150, bbox_inches='tight', facecolor='#f8f9fa')
-        print(f"Enhanced recovery chart saved to img/recovery_{strs[symbol]['id']}.png")
+        path = chart_path('recover' if simulation is None else 'fan', symbol, img_dir)
+        plt.savefig(path, dpi=150, bbox_inches='tight', facecolor='#f8f9fa')
+        print(f"Enhanced recovery chart saved to {path}")
     else:
         plt.show()
 
+    # Release the figure so batch runs don't accumulate open figures
+    plt.close(fig)
+
 
 def crash_2020_trajectories(data):
     fall_values = data.groupby('symbol').last().reset_index()
@@ -0,0 +1,82 @@
+"""
+Compact, immutable price series.
+
+PriceSeries keeps one symbol's bars as an int64 array of days since the
+epoch and a float64 (or float32) array of values, both read-only. The
+store, feeder and pipeline pass it to process, which builds a DataFrame
+only when a function needs one; the value column of that frame is a view
+of the array rather than a copy.
+"""
+
+import numpy as np
+import pandas as pd
+
+NS_PER_DAY = 86_400 * 10 ** 9
+
+
+def _readonly(array):
+    view = array.view()
+    view.flags.writeable = False
+
+    return view
+
+
+class PriceSeries:
+    """Bars of one symbol as (days since epoch, value) arrays."""
+
+    __slots__ = ('symbol', 'days', 'values')
+
+    def __init__(self, days, values, symbol=None):
+        days = np.asarray(days, dtype=np.int64)
+        values = np.asarray(values)
+        if values.dtype not in (np.float32, np.float64):
+            values = values.astype(np.float64)
+        if days.shape != values.shape or days.ndim != 1:
+            raise ValueError('days and values must be 1-d arrays of the same length')
+
+        object.__setattr__(self, 'symbol', symbol)
+        object.__setattr__(self, 'days', _readonly(days))
+        object.__setattr__(self, 'values', _readonly(values))
+
+    @classmethod
+    def from_frame(cls, data, symbol=None, dtype=np.float64):
+        """Copy the 'd' and 'value' columns of data, with values stored as dtype."""
+        days = data['d'].to_numpy('datetime64[D]').view(np.int64)
+
+        return cls(days, np.array(data['value'].to_numpy(), dtype=dtype), symbol)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('PriceSeries is immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('PriceSeries is immutable')
+
+    def __reduce__(self):
+        return PriceSeries, (self.days, self.values, self.symbol)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, rows):
+        """Bars at a slice or mask of rows; slices are views."""
+        return PriceSeries(self.days[rows], self.values[rows], self.symbol)
+
+    def __repr__(self):
+        span = ' {} to {}'.format(*self.d[[0, -1]].astype('datetime64[D]')) if len(self) else ''
+        return 'PriceSeries({!r}, {} bars{}, {})'.format(self.symbol, len(self), span, self.values.dtype)
+
+    @property
+    def d(self):
+        """Dates as a datetime64[ns] array."""
+        return (self.days * NS_PER_DAY).view('datetime64[ns]')
+
+    @property
+    def nbytes(self):
+        return self.days.nbytes + self.values.nbytes
+
+    def astype(self, dtype):
+        return PriceSeries(self.days, self.values.astype(dtype, copy=False), self.symbol)
+
+    def to_frame(self):
+        """(d, value) frame; the value column shares memory with the series."""
+        return pd.DataFrame({'d': self.d, 'value': self.values}, copy=False)
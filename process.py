@@ -1,75 +1,447 @@
 import numpy as np
+import pandas as pd
 
+import cache
+import memo
+import prices
+import returns
 
+
+def episodes(values, groups=None):
+    """
+    Index the drawdown episodes of a price array in one vectorized pass.
+
+    An episode is the run of rows sharing the same running maximum, the
+    same grouping the 'cummax' groupbys in this module use. groups holds
+    contiguous integer codes when several series are stacked in values; the
+    running maximum then restarts with each series. Per-row arrays:
+    cummax, episode (id), start (row where its peak was set), runmin (lowest
+    value so far in the episode), trough and trough_last (first and last row
+    holding that low). Per-episode arrays, indexed by episode id: ep_start,
+    ep_end, ep_min, ep_trough, ep_trough_last and ep_recovery (row where the
+    peak is exceeded, -1 while the episode is still open).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    idx = np.arange(n)
+
+    new = np.zeros(n, dtype=bool)
+    new[:1] = True
+    if groups is None:
+        cummax = np.fmax.accumulate(values) if n else values.copy()
+    else:
+        groups = np.asarray(groups)
+        cummax = pd.Series(values).groupby(groups).cummax().to_numpy()
+        new[1:] = groups[1:] != groups[:-1]
+    new[1:] |= cummax[1:] != cummax[:-1]
+    episode = np.cumsum(new) - 1
+    ep_start = np.flatnonzero(new)
+    ep_end = np.append(ep_start[1:] - 1, n - 1) if n else ep_start
+
+    runmin = pd.Series(values).groupby(episode).cummin().to_numpy()
+    prev_min = np.empty(n)
+    prev_min[:1] = np.inf
+    prev_min[1:] = runmin[:-1]
+    new_low = new | (values < prev_min)
+    trough = np.maximum.accumulate(np.where(new_low, idx, 0)) if n else idx
+    trough_last = np.maximum.accumulate(np.where(values == runmin, idx, 0)) if n else idx
+
+    return {
+        'cummax': cummax,
+        'episode': episode,
+        'start': ep_start[episode],
+        'runmin': runmin,
+        'trough': trough,
+        'trough_last': trough_last,
+        'ep_start': ep_start,
+        'ep_end': ep_end,
+        'ep_min': runmin[ep_end],
+        'ep_trough': trough[ep_end],
+        'ep_trough_last': trough_last[ep_end],
+        'ep_recovery': np.append(ep_start[1:], -1) if n else ep_start,
+    }
+
+
+def _frame(raw_data, copy=True):
+    """
+    (d, value) frame of a DataFrame or a prices.PriceSeries, which is
+    wrapped without copying its values. With copy, the caller may add
+    columns to the result.
+    """
+    if isinstance(raw_data, prices.PriceSeries):
+        return raw_data.to_frame()
+    data = raw_data[['d', 'value']]
+
+    return data.copy() if copy else data
+
+
+@memo.memoize(version=1)
 def crashes(raw_data):
-    data = raw_data[['d', 'value']].copy()
-    data = data.reset_index(drop=True)
+    data = _frame(raw_data, copy=False).reset_index(drop=True)
+    values = data['value'].to_numpy(np.float64)
+    ep = episodes(values)
+
+    # Keep each episode from its peak to the last time its low was hit, and
+    # the whole of the current (all-time high) episode
     ath = data['value'].max()
-    data['cummax'] = data['value'].cummax()
-    data['min'] = data.groupby('cummax')['value'].transform('min')
-    data = data[::-1]
-    data['cummin'] = data.groupby('cummax')['value'].agg('cummin')
-    data = data[::-1]
-    data = data[(data['cummin'] == data['min']) | (data['cummax'] == ath)]
-    data = data.reset_index(drop=True)
-    data['ord_d'] = data.groupby('cummax').cumcount()
-    data['delta'] = data.groupby('cummax')['value'].transform('first')
-    data['d_first'] = data.groupby('cummax')['d'].transform('first')
-    data['delta'] = data['value'] / data['delta'] - 1
+    rows = np.arange(len(values))
+    rows = rows[(rows <= ep['ep_trough_last'][ep['episode']]) | (ep['cummax'] == ath)]
 
-    data = data[['ord_d', 'd', 'value', 'delta', 'cummax']]
+    return _crash_frame(data['d'], values, rows, ep['start'][rows], ep['cummax'][rows])
 
-    return data
 
+def _crash_frame(d, values, rows, start, cummax):
+    """crashes() rows of a (d, values) history, with the peak row and value of each."""
+    return pd.DataFrame({
+        'ord_d': rows - start,
+        'd': d.take(rows).reset_index(drop=True),
+        'value': values[rows],
+        'delta': values[rows] / values[start] - 1,
+        'cummax': cummax,
+    })
+
+
+class CrashState:
+    """
+    crashes() kept up to date as new bars arrive.
+
+    Once a higher peak is set, the rows an episode contributes to crashes()
+    never change again, so closed episodes are kept as row ranges of the
+    history. The open episode, from the all-time high on, is a few scalars:
+    its peak row and value, its running low and the last row at that low.
+    update() only processes the new bars, and frame() gathers the rows
+    from the history, identical to crashes() on it.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.last_d = None
+        self.last_value = np.nan
+        self._peak_row = 0
+        self._peak = np.nan
+        self._low = np.nan
+        self._trough_last = 0
+        # Peak row, last kept row and peak value of each closed episode
+        self._starts = np.zeros(0, dtype=np.int64)
+        self._ends = np.zeros(0, dtype=np.int64)
+        self._peaks = np.zeros(0)
+        # State before the last bar, which a later update may revise
+        self._before = self._state()
+
+    def _state(self):
+        return (self.rows, self.last_d, self.last_value, self._peak_row, self._peak,
+                self._low, self._trough_last, len(self._starts))
+
+    def _restore(self, state):
+        (self.rows, self.last_d, self.last_value, self._peak_row, self._peak,
+         self._low, self._trough_last, closed) = state
+        self._starts, self._ends, self._peaks = \
+            self._starts[:closed], self._ends[:closed], self._peaks[:closed]
 
+    @classmethod
+    def from_data(cls, raw_data):
+        return cls().update(raw_data)
+
+    def matches(self, raw_data):
+        """
+        Whether raw_data starts with the bars this state was built from,
+        judged by its last bar, which may have been revised, and the one
+        before it.
+        """
+        data = _frame(raw_data, copy=False)
+        if len(data) < self.rows:
+            return False
+        if self.rows and data['d'].iat[self.rows - 1] != self.last_d:
+            return False
+        before, before_d, before_value = self._before[:3]
+
+        return not before or (data['d'].iat[before - 1] == before_d and
+                              data['value'].iat[before - 1] == before_value)
+
+    def update(self, raw_data):
+        """
+        Apply the bars of raw_data from the last one seen on.
+
+        Earlier bars are skipped and a bar on the last date seen replaces it,
+        so raw_data may overlap the history and a partial session is revised.
+        """
+        new = _frame(raw_data, copy=False)
+        if self.rows:
+            new = new[new['d'] >= self.last_d]
+            if len(new) and new['d'].iat[0] == self.last_d:
+                self._restore(self._before)
+        if not len(new):
+            return self
+
+        values = new['value'].to_numpy(np.float64)
+        if len(new) > 1:
+            self._apply(values[:-1], new['d'].iat[-2])
+        self._before = self._state()
+        self._apply(values[-1:], new['d'].iat[-1])
+
+        return self
+
+    def _apply(self, values, last_d):
+        n = self.rows
+        if self.rows:
+            # The open episode goes first as its peak and low, so episodes()
+            # continues it without seeing its bars again
+            rows = np.r_[self._peak_row, self._trough_last, n + np.arange(len(values))]
+            ep = episodes(np.r_[self._peak, self._low, values])
+        else:
+            rows = np.arange(len(values))
+            ep = episodes(values)
+
+        closed = slice(0, len(ep['ep_start']) - 1)
+        self._starts = np.r_[self._starts, rows[ep['ep_start'][closed]]]
+        self._ends = np.r_[self._ends, rows[ep['ep_trough_last'][closed]]]
+        self._peaks = np.r_[self._peaks, ep['cummax'][ep['ep_start'][closed]]]
+
+        self._peak_row = rows[ep['ep_start'][-1]]
+        self._peak = ep['cummax'][-1]
+        self._low = ep['ep_min'][-1]
+        self._trough_last = rows[ep['ep_trough_last'][-1]]
+        self.rows = n + len(values)
+        self.last_d = last_d
+        self.last_value = values[-1]
+
+    def frame(self, raw_data):
+        """The crashes() output of raw_data, the history this state was built from."""
+        data = _frame(raw_data, copy=False)
+        values = data['value'].to_numpy(np.float64)
+        starts, ends, peaks = self._starts, self._ends, self._peaks
+        if self.rows:
+            starts = np.r_[starts, self._peak_row]
+            ends = np.r_[ends, self.rows - 1]
+            peaks = np.r_[peaks, self._peak]
+
+        # Row ranges starts[i]..ends[i] back to back
+        lengths = ends - starts + 1
+        offsets = np.cumsum(lengths) - lengths
+        rows = np.arange(lengths.sum()) - np.repeat(offsets - starts, lengths)
+
+        return _crash_frame(data['d'], values, rows, np.repeat(starts, lengths),
+                            np.repeat(peaks, lengths))
+
+
+def update_crashes(raw_data, symbol):
+    """
+    crashes() of raw_data kept up to date through the CrashState saved for symbol.
+
+    Only the bars from the state's last one on are applied. The state is
+    rebuilt from raw_data when it is missing or its last two bars are not
+    those of raw_data; older revisions of the history are not detected.
+    """
+    data = _frame(raw_data, copy=False)
+    name = 'crashes_{}'.format(symbol.replace('^', ''))
+    state = cache.load_state(name)
+
+    if isinstance(state, CrashState) and state.matches(data):
+        state.update(data.iloc[max(state.rows - 1, 0):])
+    else:
+        state = CrashState.from_data(data)
+    cache.save_state(state, name)
+
+    return state.frame(data)
+
+
+@memo.memoize(version=1)
 def drawdown(raw_data):
-    data = raw_data[['d', 'value']].copy()
-    data['factor'] = data['value'].diff().fillna(0)
-    data['factor'] = data['value'] / (data['value'] - data['factor'])
-
-    drawdown = []
-    current_drawdown = 1
-    for i in np.arange(len(data['factor'])):
-        current_drawdown = min(current_drawdown * data['factor'][i], 1)
-        drawdown.append(current_drawdown)
-        
-    data['drawdown'] = drawdown
+    data = _frame(raw_data)
+    data['factor'] = returns.factors(data['value'])
+
+    values = data['value'].to_numpy(np.float64)
+    ep = episodes(values)
+    d = data['d'].to_numpy()
+
+    # Compounding the daily factors and capping at 1 is the ratio to the running max
+    data['drawdown'] = np.minimum(values / ep['cummax'], 1)
+    data['peak_d'] = d[ep['start']]
+    data['trough_d'] = d[ep['trough']]
+    data['duration'] = np.arange(len(values)) - ep['start']
 
     return data
 
 
+@memo.memoize(version=1)
 def recover(raw_data):
-    data = raw_data[['d', 'value']].copy()
-    data['delta'] = data['value'].diff().fillna(0)
-    data['delta'] = data['delta'] / (data['value'] - data['delta']) + 1
+    data = _frame(raw_data)
+    data['delta'] = returns.factors(data['value'])
+
+    ep = episodes(data['value'])
+    episode = ep['episode']
 
     data['cummax'] = data['value'].cummax()
-    data['cumdelta'] = data.groupby('cummax')['delta'].cumprod()
-    data['min'] = data.groupby('cummax')['cumdelta'].transform('min')
+    data['cumdelta'] = data['delta'].groupby(episode).cumprod()
+    data['min'] = data['cumdelta'].groupby(episode).transform('min')
     data['cumdelta'] = data['cumdelta'] / data['min']
     data['cumdelta'] = data['cumdelta'] - 1
 
-    # Calculate the ordering by days
-    data['ord_d'] = data.groupby('cummax').cumcount()
-    
-    # Find the index of the minimum value for each cummax group
-    try:
-        min_idx = data.groupby('cummax')['value'].idxmin().to_dict()
-        data['ord_d'] = data['ord_d'] - \
-            data['cummax'].map(min_idx).apply(lambda x: data.iloc[x]['ord_d'] if x in data.index else 0)
-    except Exception as e:
-        print(f"Warning in recover function: {e}")
-        # Create a simpler version if the above fails
-        # Just keep the ord_d as is (days since the beginning)
-        pass
+    # Days since the bottom (first occurrence of the low) of each episode
+    data['ord_d'] = np.arange(len(data)) - ep['ep_trough'][episode]
+
+    return data
+
+
+def episode_summary(data, column):
+    """
+    Summarize each episode of a crashes() or recover() frame in one pass.
+
+    Episodes are the contiguous runs of equal 'cummax'. Returns a frame with
+    one row per episode (cummax, year, min, max and last of column,
+    last_ord_d, length, start row) and the (ord_d, column) arrays of each
+    episode for plotting.
+    """
+    cummax = data['cummax'].to_numpy()
+    if len(cummax) == 0:
+        return pd.DataFrame(columns=['cummax', 'year', 'min', 'max', 'last',
+                                     'last_ord_d', 'length', 'start']), []
+
+    starts = np.flatnonzero(np.r_[True, cummax[1:] != cummax[:-1]])
+    ends = np.r_[starts[1:], len(cummax)] - 1
+    values = data[column].to_numpy()
+    ord_d = data['ord_d'].to_numpy()
+
+    summary = pd.DataFrame({
+        'cummax': cummax[starts],
+        'year': pd.DatetimeIndex(data['d'].to_numpy()[starts]).year.astype(str),
+        'min': np.minimum.reduceat(values, starts),
+        'max': np.maximum.reduceat(values, starts),
+        'last': values[ends],
+        'last_ord_d': np.maximum.reduceat(ord_d, starts),
+        'length': ends - starts + 1,
+        'start': starts,
+    })
+    lines = list(zip(np.split(ord_d, starts[1:]), np.split(values, starts[1:])))
+
+    return summary, lines
+
+
+# Panel columns accepted as prices, and how to turn them into a price level
+PANEL_PRICES = {
+    'value': lambda values: values,
+    # Cumulative return since the first bar, 1 + cumdelta is the price relative to it
+    'cumdelta': lambda values: 1 + values,
+}
+
+
+def _panel_prices(panel):
+    """Long (symbol, d, value) frame of a panel.Panel holding prices or cumulative returns."""
+    if panel.column not in PANEL_PRICES:
+        raise ValueError('Panel column {!r} is not a price, expected one of {}'.format(
+            panel.column, sorted(PANEL_PRICES)))
+    data = panel.long()
+    data['value'] = PANEL_PRICES[panel.column](data.pop(panel.column))
+
+    return data
+
+
+def _long_frame(data):
+    """Return a (symbol, d, value) frame sorted by symbol and date, from a long frame or a panel."""
+    if hasattr(data, 'long'):
+        data = _panel_prices(data)
+    data = data[['symbol', 'd', 'value']].sort_values(['symbol', 'd'], kind='stable')
+    data = data.reset_index(drop=True)
+
+    return data, pd.factorize(data['symbol'])[0]
+
+
+def _symbol_episode(ep, codes):
+    # Number episodes from 0 within each symbol
+    first = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+
+    return ep['episode'] - ep['episode'][first][codes]
+
+
+@memo.memoize(version=1)
+def crashes_batch(data):
+    """
+    crashes() for many symbols in one pass.
+
+    data is a long (symbol, d, value) frame or a panel.Panel. Returns the
+    crashes() columns for every symbol, keyed by symbol and episode.
+    """
+    data, codes = _long_frame(data)
+    values = data['value'].to_numpy(np.float64)
+    ep = episodes(values, codes)
+
+    # The all-time high of each symbol is the running max on its last row
+    last = np.flatnonzero(np.r_[codes[1:] != codes[:-1], True])
+    ath = ep['cummax'][last][codes]
+    rows = np.arange(len(values))
+    rows = rows[(rows <= ep['ep_trough_last'][ep['episode']]) | (ep['cummax'] == ath)]
+
+    data = pd.DataFrame({
+        'symbol': data['symbol'].take(rows).reset_index(drop=True),
+        'episode': _symbol_episode(ep, codes)[rows],
+        'ord_d': rows - ep['start'][rows],
+        'd': data['d'].take(rows).reset_index(drop=True),
+        'value': values[rows],
+        'delta': values[rows] / values[ep['start'][rows]] - 1,
+        'cummax': ep['cummax'][rows],
+    })
+
+    return data
+
+
+@memo.memoize(version=1)
+def recover_batch(data):
+    """recover() for many symbols in one pass, keyed by symbol and episode."""
+    data, codes = _long_frame(data)
+    values = data['value'].to_numpy(np.float64)
+    ep = episodes(values, codes)
+    episode = ep['episode']
+
+    data['delta'] = returns.factors(data['value'], codes)
+
+    data['episode'] = _symbol_episode(ep, codes)
+    data['cummax'] = ep['cummax']
+    data['cumdelta'] = data['delta'].groupby(episode).cumprod()
+    data['min'] = data['cumdelta'].groupby(episode).transform('min')
+    data['cumdelta'] = data['cumdelta'] / data['min'] - 1
+    data['ord_d'] = np.arange(len(data)) - ep['ep_trough'][episode]
 
     return data
 
 
+@memo.memoize(version=1)
+def episode_table(data):
+    """
+    One row per drawdown episode of every symbol in data (long frame or panel).
+
+    Columns: symbol, episode, peak_d, trough_d, recovery_d (NaT while open),
+    peak, depth, days_to_trough and days_to_recover (-1 while open).
+    """
+    data, codes = _long_frame(data)
+    values = data['value'].to_numpy(np.float64)
+    ep = episodes(values, codes)
+    d = data['d'].to_numpy()
+    start, trough, recovery = ep['ep_start'], ep['ep_trough'], ep['ep_recovery']
+
+    # An episode is only recovered by a new high of the same symbol
+    recovered = recovery >= 0
+    recovered[recovered] = codes[recovery[recovered]] == codes[start[recovered]]
+    recovery = np.where(recovered, recovery, -1)
+
+    recovery_d = np.full(len(start), np.datetime64('NaT'), dtype=d.dtype)
+    recovery_d[recovered] = d[recovery[recovered]]
+
+    return pd.DataFrame({
+        'symbol': data['symbol'].to_numpy()[start],
+        'episode': _symbol_episode(ep, codes)[start],
+        'peak_d': d[start],
+        'trough_d': d[trough],
+        'recovery_d': recovery_d,
+        'peak': values[start],
+        'depth': ep['ep_min'] / values[start] - 1,
+        'days_to_trough': trough - start,
+        'days_to_recover': np.where(recovered, recovery - start, -1),
+    })
+
+
 def crash_2020(raw_data):
-    data = raw_data[['d', 'value']].copy()
-    data['delta'] = data['value'].diff().fillna(0)
-    data['delta'] = data['delta'] / (data['value'] - data['delta']) + 1
+    data = _frame(raw_data)
+    data['delta'] = returns.factors(data['value'])
     data['cumdelta'] = data['delta'].cumprod()
     data['cumdelta'] = data['cumdelta'] - 1
 
@@ -0,0 +1,85 @@
+"""
+Headless chart rendering with a render-once cache.
+
+Charts are drawn with the non-interactive Agg backend and each rendered
+file gets a stamp holding a hash of its input data and chart
+configuration. A chart whose stamp still matches is not drawn again.
+The footnote date is the last bar of the data, so it is covered too.
+"""
+
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+# Bump when plot.crashes or plot.recover change what the charts look like
+CHART_VERSION = 2
+
+IMG_DIR = 'img'
+# Stamps are kept in this directory next to the charts
+STAMP_DIR = '.render'
+
+
+def _plot():
+    # Select the backend before plot gets a chance to import pyplot with the
+    # default one; switching later also works as long as no figure is open
+    import matplotlib
+    matplotlib.use('Agg')
+    import plot
+
+    return plot
+
+
+def chart_key(kind, data, symbol):
+    """Hash of the chart input data and configuration."""
+    digest = hashlib.sha256()
+    digest.update('{}|{}|{}'.format(kind, symbol, CHART_VERSION).encode())
+    digest.update(pd.util.hash_pandas_object(data, index=True).to_numpy().tobytes())
+    digest.update(','.join(map(str, data.columns)).encode())
+
+    return digest.hexdigest()
+
+
+def _stamp_path(path):
+    return os.path.join(os.path.dirname(path), STAMP_DIR, '{}.key'.format(os.path.basename(path)))
+
+
+def render_chart(kind, data, symbol, force=False, img_dir=IMG_DIR):
+    """
+    Draw the 'crashes' or 'recover' chart for symbol into img_dir unless it
+    is up to date.
+
+    Returns (path, rendered) where rendered is False when the existing file
+    was kept.
+    """
+    plot = _plot()
+    path = plot.chart_path(kind, symbol, img_dir)
+    key = chart_key(kind, data, symbol)
+    stamp = _stamp_path(path)
+
+    if not force and os.path.exists(path) and os.path.exists(stamp):
+        with open(stamp) as f:
+            if f.read() == key:
+                return path, False
+
+    os.makedirs(img_dir, exist_ok=True)
+    getattr(plot, kind)(data, symbol, save=True, img_dir=img_dir)
+
+    os.makedirs(os.path.dirname(stamp), exist_ok=True)
+    with open(stamp, 'w') as f:
+        f.write(key)
+
+    return path, True
+
+
+def _render_job(job):
+    return render_chart(*job)
+
+
+def render_many(jobs, workers=2):
+    """Render (kind, data, symbol) jobs on a process pool, skipping unchanged charts."""
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(workers, mp_context=context) as executor:
+        return list(executor.map(_render_job, jobs))
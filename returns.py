@@ -0,0 +1,201 @@
+"""
+Daily returns and rolling/expanding statistics.
+
+Daily return factors are computed once per series. Rolling volatility,
+Sharpe and beta are differences of cumulative sums, so each costs O(n)
+whatever the window length. Missing values are skipped, which lets a
+series be compared with an index that trades on other days.
+"""
+
+import os
+
+import numpy as np
+
+import cache
+import store
+
+TRADING_DAYS = 252
+
+
+def factors(values, groups=None):
+    """Daily gross return factors value[i] / value[i-1], 1 on the first row of each series."""
+    values = np.asarray(values, dtype=np.float64)
+    result = np.ones(len(values))
+    result[1:] = values[1:] / values[:-1]
+    if groups is not None:
+        groups = np.asarray(groups)
+        result[1:][groups[1:] != groups[:-1]] = 1
+
+    return result
+
+
+def _rolling_sums(x, window):
+    """Rolling sums of x and the count of non-NaN terms, NaN until the window is full."""
+    valid = ~np.isnan(x)
+    sums = np.concatenate(([0.0], np.cumsum(np.where(valid, x, 0.0))))
+    counts = np.concatenate(([0], np.cumsum(valid)))
+
+    total = np.full(len(x), np.nan)
+    count = np.zeros(len(x), dtype=np.int64)
+    total[window - 1:] = sums[window:] - sums[:-window]
+    count[window - 1:] = counts[window:] - counts[:-window]
+
+    return total, count
+
+
+def _expanding_sums(x):
+    valid = ~np.isnan(x)
+
+    return np.cumsum(np.where(valid, x, 0.0)), np.cumsum(valid)
+
+
+def _moments(x, sums, min_periods=2):
+    # Centre on the overall mean first to limit cancellation in sum(x^2)
+    x = x - np.nanmean(x) if np.any(~np.isnan(x)) else x
+    s1, n = sums(x)
+    s2, _ = sums(x * x)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = s1 / n
+        var = np.maximum(s2 - s1 * mean, 0) / (n - 1)
+    var[n < max(2, min_periods)] = np.nan
+
+    return var
+
+
+def rolling_volatility(returns, window, annualize=True, min_periods=None):
+    """Standard deviation of daily returns over a rolling window, annualized by default."""
+    var = _moments(np.asarray(returns, dtype=np.float64), lambda x: _rolling_sums(x, window),
+                   window if min_periods is None else min_periods)
+
+    return np.sqrt(var * (TRADING_DAYS if annualize else 1))
+
+
+def expanding_volatility(returns, annualize=True):
+    var = _moments(np.asarray(returns, dtype=np.float64), _expanding_sums)
+
+    return np.sqrt(var * (TRADING_DAYS if annualize else 1))
+
+
+def rolling_sharpe(returns, window, risk_free=0.0, min_periods=None):
+    """Annualized Sharpe ratio of daily returns over a rolling window."""
+    returns = np.asarray(returns, dtype=np.float64) - risk_free / TRADING_DAYS
+    total, count = _rolling_sums(returns, window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = total / count
+
+        return mean * TRADING_DAYS / rolling_volatility(returns, window, True, min_periods)
+
+
+def rolling_beta(returns, market_returns, window, min_periods=None):
+    """
+    Rolling beta of returns against market_returns, over rows where both exist.
+
+    min_periods defaults to half the window, so a few days missing from one
+    of the calendars don't blank out the whole window.
+    """
+    returns = np.asarray(returns, dtype=np.float64)
+    market_returns = np.asarray(market_returns, dtype=np.float64)
+    both = ~np.isnan(returns) & ~np.isnan(market_returns)
+    x = np.where(both, market_returns - np.nanmean(market_returns), np.nan)
+    y = np.where(both, returns - np.nanmean(returns), np.nan)
+
+    sx, n = _rolling_sums(x, window)
+    sy, _ = _rolling_sums(y, window)
+    sxy, _ = _rolling_sums(x * y, window)
+    sxx, _ = _rolling_sums(x * x, window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        beta = (sxy - sx * sy / n) / (sxx - sx * sx / n)
+    beta[n < max(2, window // 2 if min_periods is None else min_periods)] = np.nan
+
+    return beta
+
+
+def expanding_max_drawdown(values):
+    values = np.asarray(values, dtype=np.float64)
+
+    return np.minimum.accumulate(values / np.fmax.accumulate(values) - 1)
+
+
+def rolling_max_drawdown(values, window, chunk_size=1 << 22):
+    """
+    Deepest peak-to-trough fall inside each trailing window.
+
+    Uses strided views of the windows, running max across each in chunks
+    of about chunk_size elements, so the work is O(n * window) in NumPy
+    with bounded memory.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    result = np.full(len(values), np.nan)
+    if len(values) < window:
+        return result
+
+    windows = np.lib.stride_tricks.sliding_window_view(values, window)
+    step = max(1, chunk_size // window)
+    for lo in range(0, len(windows), step):
+        chunk = windows[lo:lo + step]
+        result[window - 1 + lo:window - 1 + lo + len(chunk)] = \
+            np.min(chunk / np.maximum.accumulate(chunk, axis=1), axis=1) - 1
+
+    return result
+
+
+def daily_returns(data):
+    """Add factor, ret and log_ret columns to a (d, value) frame."""
+    data = data[['d', 'value']].copy()
+    data['factor'] = factors(data['value'])
+    data['ret'] = data['factor'] - 1
+    data['log_ret'] = np.log(data['factor'])
+
+    return data
+
+
+def stats(data, window=63, market=None):
+    """
+    Rolling and expanding statistics of a (d, value) frame.
+
+    market is an optional (d, value) frame, e.g. ^GSPC, for the rolling beta;
+    it is aligned on dates.
+    """
+    data = daily_returns(data)
+    ret = data['ret'].to_numpy(copy=True)
+    ret[:1] = np.nan
+    values = data['value'].to_numpy()
+
+    data['volatility'] = rolling_volatility(ret, window)
+    data['sharpe'] = rolling_sharpe(ret, window)
+    data['max_drawdown'] = rolling_max_drawdown(values, window)
+    data['expanding_volatility'] = expanding_volatility(ret)
+    data['expanding_max_drawdown'] = expanding_max_drawdown(values)
+    if market is not None:
+        market = daily_returns(market).iloc[1:]
+        market_ret = data[['d']].merge(market[['d', 'ret']], on='d', how='left')['ret']
+        data['beta'] = rolling_beta(ret, market_ret.to_numpy(), window)
+
+    return data
+
+
+def _stats_path(symbol, window):
+    return os.path.join(store.STORE_DIR, '{}.stats{}.npz'.format(symbol, window))
+
+
+def cached_stats(symbol, window=63, market_symbol='^GSPC'):
+    """
+    stats() for a stored symbol, kept next to its price file.
+
+    The saved result is reused until the stored prices of the symbol or of
+    market_symbol are newer than it. Returns None if symbol is not stored.
+    """
+    if symbol not in store.load_index() or not os.path.exists(store._symbol_path(symbol)):
+        return None
+
+    path = _stats_path(symbol, window)
+    sources = [store._symbol_path(s) for s in (symbol, market_symbol) if s]
+    if os.path.exists(path) and \
+            all(os.path.getmtime(path) >= os.path.getmtime(s) for s in sources if os.path.exists(s)):
+        return cache.load_columns(path)
+
+    market = store.read(market_symbol) if market_symbol and market_symbol != symbol else None
+    result = stats(store.read(symbol), window, market)
+    cache.save_columns(result, path)
+
+    return result
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Asyncio HTTP service for the crash and recovery analytics.
+
+Endpoints:
+    GET /crashes/{symbol}             process.crashes as JSON
+    GET /recover/{symbol}             process.recover as JSON
+    GET /chart/crashes/{symbol}.png   crash chart
+    GET /chart/recover/{symbol}.png   recovery chart
+
+Prices come from the local price store (or any data source function) and
+results go through the memo and render caches. Encoded JSON bodies are kept
+in memory keyed on the content of the prices, and concurrent requests for
+the same result share one computation.
+
+Usage:
+    python service.py --port 8080
+    python service.py --loadtest --fake --requests 2000 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import functools
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote
+
+import numpy as np
+import pandas as pd
+
+import memo
+import process
+import render
+import store
+
+ANALYTICS = {
+    'crashes': process.crashes,
+    'recover': process.recover,
+}
+
+# Charts of any source other than the store are drawn here, so synthetic
+# data never replaces the real charts under img/
+SERVICE_IMG_DIR = 'img/service'
+
+REASONS = {200: 'OK', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+@functools.lru_cache(maxsize=None)
+def fake_source(symbol, n=10000):
+    """Deterministic random walk standing in for stored prices."""
+    rng = np.random.default_rng(sum(map(ord, symbol)))
+    values = 100 * np.exp(np.cumsum(rng.normal(0.0003, 0.012, n)))
+
+    return pd.DataFrame({'d': pd.bdate_range('1990-01-01', periods=n), 'value': values})
+
+
+class Service:
+    def __init__(self, data_source=store.read, workers=4, max_bodies=256, img_dir=None):
+        self.data_source = data_source
+        if img_dir is None:
+            img_dir = render.IMG_DIR if data_source is store.read else SERVICE_IMG_DIR
+        self.img_dir = img_dir
+        self.max_bodies = max_bodies
+        self._executor = ThreadPoolExecutor(workers)
+        # pyplot is not thread safe, so charts are drawn one at a time
+        self._chart_executor = ThreadPoolExecutor(1)
+        self._inflight = {}
+        self._bodies = OrderedDict()
+        self._bodies_lock = threading.Lock()
+
+    async def _coalesce(self, key, executor, func, *args):
+        """Run func once for all concurrent requests with the same key."""
+        if key not in self._inflight:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(executor, func, *args)
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+        return await asyncio.shield(self._inflight[key])
+
+    def _analytics(self, kind, symbol):
+        data = self.data_source(symbol)
+        if data is None:
+            return None
+
+        return ANALYTICS[kind](data)
+
+    def _json(self, kind, symbol):
+        data = self.data_source(symbol)
+        if data is None:
+            return None
+
+        key = memo.key(kind, 0, [data], {})
+        with self._bodies_lock:
+            body = self._bodies.get(key)
+            if body is not None:
+                self._bodies.move_to_end(key)
+                return body
+
+        body = ANALYTICS[kind](data).to_json(orient='split', index=False, date_format='iso').encode()
+        with self._bodies_lock:
+            self._bodies[key] = body
+            while len(self._bodies) > self.max_bodies:
+                self._bodies.popitem(last=False)
+
+        return body
+
+    def _chart(self, kind, symbol):
+        result = self._analytics(kind, symbol)
+        if result is None:
+            return None
+        path, _ = render.render_chart(kind, result, symbol, img_dir=self.img_dir)
+        with open(path, 'rb') as f:
+            return f.read()
+
+    async def route(self, method, path):
+        """Return (status, content type, body) for a request."""
+        if method != 'GET':
+            return 405, 'application/json', b'{"error": "method not allowed"}'
+
+        parts = [unquote(part) for part in path.split('?')[0].strip('/').split('/')]
+        if len(parts) == 2 and parts[0] in ANALYTICS:
+            kind, symbol = parts
+            body = await self._coalesce((kind, symbol), self._executor, self._json, kind, symbol)
+            if body is None:
+                return 404, 'application/json', json.dumps({'error': 'unknown symbol ' + symbol}).encode()
+            return 200, 'application/json', body
+
+        if len(parts) == 3 and parts[0] == 'chart' and parts[1] in ANALYTICS and parts[2].endswith('.png'):
+            kind, symbol = parts[1], parts[2][:-4]
+            body = await self._coalesce(('chart', kind, symbol), self._chart_executor,
+                                        self._chart, kind, symbol)
+            if body is None:
+                return 404, 'application/json', json.dumps({'error': 'unknown symbol ' + symbol}).encode()
+            return 200, 'image/png', body
+
+        return 404, 'application/json', b'{"error": "not found"}'
+
+    async def handle(self, reader, writer):
+        try:
+            request = await reader.readline()
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            method, path, _ = request.decode('latin-1').split(' ', 2)
+            try:
+                status, content_type, body = await self.route(method, path)
+            except Exception as e:
+                status, content_type, body = 500, 'application/json', json.dumps({'error': repr(e)}).encode()
+
+            writer.write('HTTP/1.1 {} {}\r\nContent-Type: {}\r\nContent-Length: {}\r\n'
+                         'Connection: close\r\n\r\n'.format(status, REASONS[status], content_type,
+                                                            len(body)).encode('latin-1'))
+            writer.write(body)
+            await writer.drain()
+        except (ValueError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host='localhost', port=8080):
+        return await asyncio.start_server(self.handle, host, port)
+
+
+async def _request(host, port, path):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write('GET {} HTTP/1.1\r\nHost: {}\r\nConnection: close\r\n\r\n'.format(path, host).encode())
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    await reader.read()
+    writer.close()
+
+    return status
+
+
+async def loadtest(host, port, paths, requests=1000, concurrency=50):
+    """Issue requests over paths with bounded concurrency and return latency percentiles in ms."""
+    latencies = []
+    statuses = {}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(path):
+        async with semaphore:
+            start = time.perf_counter()
+            status = await _request(host, port, path)
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(paths[i % len(paths)]) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+
+    return {
+        'requests': requests,
+        'statuses': statuses,
+        'seconds': elapsed,
+        'rps': requests / elapsed,
+        'p50_ms': p50,
+        'p90_ms': p90,
+        'p99_ms': p99,
+        'max_ms': max(latencies),
+    }
+
+
+async def _serve(args):
+    service = Service(fake_source if args.fake else store.read)
+    server = await service.start(args.host, args.port)
+
+    if not args.loadtest:
+        print(f"Serving on http://{args.host}:{args.port}")
+        async with server:
+            await server.serve_forever()
+        return
+
+    symbols = args.symbols or ['^GSPC', '^BVSP', 'AAPL', 'MSFT']
+    paths = ['/{}/{}'.format(kind, symbol) for symbol in symbols for kind in ANALYTICS]
+    async with server:
+        report = await loadtest(args.host, args.port, paths, args.requests, args.concurrency)
+    print(json.dumps(report, indent=1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Crash and recovery analytics service')
+    parser.add_argument('--host', type=str, default='localhost')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--fake', action='store_true', help='Serve synthetic prices instead of the store')
+    parser.add_argument('--loadtest', action='store_true',
+                        help='Start the service, run a local load test and print latency percentiles')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--symbols', type=str, nargs='+', help='Symbols to request in the load test')
+
+    args = parser.parse_args()
+    asyncio.run(_serve(args))
+
+
+if __name__ == "__main__":
+    main()
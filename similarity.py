@@ -0,0 +1,164 @@
+"""
+Similarity search over the drawdown episodes of many symbols.
+
+Every episode deeper than MIN_DEPTH becomes one row of a (episodes x
+LENGTH) float32 matrix: its move from the peak (value / peak - 1) on each
+of its first LENGTH sessions, zero-padded after it recovers. Finding the
+episodes whose first n days look most like the current drawdown is then
+a single matrix-vector product over the first n columns, using running
+sums of squares for the row norms, so a query over tens of thousands of
+episodes takes milliseconds.
+
+    index = similarity.build()              # every symbol in the store
+    index.query(similarity.trajectory(store.read('^GSPC')), symbol='^GSPC')
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+import cache
+import prices
+import process
+import store
+
+SIMILARITY_DIR = 'data/similarity'
+
+# Sessions from the peak kept per episode
+LENGTH = 250
+# Shallower episodes (daily noise) are left out of the index
+MIN_DEPTH = -.02
+
+TABLE_COLUMNS = ['episode', 'peak_d', 'trough_d', 'recovery_d', 'peak', 'depth',
+                 'days_to_trough', 'days_to_recover']
+
+
+def _index_path(name):
+    return os.path.join(SIMILARITY_DIR, '{}.npz'.format(name))
+
+
+def trajectory(raw_data, length=LENGTH):
+    """Move from the peak of the open (current) episode of a (d, value) series."""
+    if isinstance(raw_data, prices.PriceSeries):
+        values = raw_data.values.astype(np.float64)
+    else:
+        values = raw_data['value'].to_numpy(np.float64)
+    if not len(values):
+        return values
+    # The episode starts where the all-time high is first reached
+    start = int(np.argmax(values))
+
+    return values[start:start + length] / values[start] - 1
+
+
+class Index:
+    """Episode trajectories and the process.episode_table() rows they belong to."""
+
+    def __init__(self, trajectories, lengths, table):
+        self.trajectories = trajectories
+        self.lengths = lengths
+        self.table = table
+        # Squared norm of the first n + 1 days of every row, in column n
+        self._norms = np.cumsum(np.square(trajectories, dtype=np.float64), axis=1)
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def query(self, current, k=10, symbol=None):
+        """
+        The k episodes whose first n days are closest to current, a move from
+        the peak over n days (see trajectory()), nearest first.
+
+        Only episodes that lasted at least n days are compared: the others had
+        recovered by then. n is capped at the index length. The open episode
+        of symbol, the one current usually comes from, is left out. Returns
+        the table rows with 'distance', the root mean square difference.
+        """
+        current = np.asarray(current, dtype=np.float64)[:self.trajectories.shape[1]]
+        n = len(current)
+        if n == 0:
+            return self.table.iloc[:0].assign(distance=np.float64())
+
+        # |a - q|^2 = |a|^2 - 2 a.q + |q|^2 over the first n columns
+        dot = self.trajectories[:, :n] @ current.astype(np.float32)
+        distance = self._norms[:, n - 1] - 2 * dot + current @ current
+        distance[self.lengths < n] = np.inf
+        if symbol is not None:
+            distance[((self.table['symbol'] == symbol) & (self.table['days_to_recover'] < 0)).to_numpy()] = np.inf
+
+        k = min(k, int(np.isfinite(distance).sum()))
+        nearest = np.argpartition(distance, k)[:k] if k < len(distance) else np.arange(len(distance))
+        nearest = nearest[np.argsort(distance[nearest], kind='stable')][:k]
+
+        result = self.table.iloc[nearest].copy()
+        result['distance'] = np.sqrt(np.maximum(distance[nearest], 0) / n)
+
+        return result.reset_index(drop=True)
+
+    def save(self, name='index'):
+        os.makedirs(SIMILARITY_DIR, exist_ok=True)
+        path = _index_path(name)
+        symbols = self.table['symbol'].astype('category')
+        cache.save_arrays(path, trajectories=self.trajectories, lengths=self.lengths,
+                          symbols=np.asarray(symbols.cat.categories, dtype=str),
+                          code=symbols.cat.codes.to_numpy(np.int32),
+                          **{c: self.table[c].to_numpy() for c in TABLE_COLUMNS})
+
+        return path
+
+
+def from_data(data, length=LENGTH, min_depth=MIN_DEPTH):
+    """Index of the episodes of a long (symbol, d, value) frame or a panel.Panel."""
+    table = process.episode_table(data)
+
+    # Same order as episode_table, so episode ids are its rows
+    if hasattr(data, 'long'):
+        data = process._panel_prices(data)
+    data = data[['symbol', 'd', 'value']].sort_values(['symbol', 'd'], kind='stable')
+    codes = pd.factorize(data['symbol'])[0]
+    values = data['value'].to_numpy(np.float64)
+    ep = process.episodes(values, codes)
+
+    keep = np.flatnonzero(table['depth'].to_numpy() <= min_depth)
+    start = ep['ep_start'][keep]
+    lengths = ep['ep_end'][keep] - start + 1
+
+    days = np.arange(length)
+    rows = start[:, None] + days[None, :]
+    inside = days[None, :] < lengths[:, None]
+    moves = values[np.where(inside, rows, start[:, None])] / values[start][:, None] - 1
+    trajectories = np.where(inside, moves, 0).astype(np.float32)
+
+    return Index(trajectories, lengths, table.iloc[keep].reset_index(drop=True))
+
+
+def build(symbols=None, name='index', length=LENGTH, min_depth=MIN_DEPTH):
+    """Index every episode of symbols (default: all of the store) and save it."""
+    symbols = sorted(store.load_index()) if symbols is None else list(symbols)
+    data = store.read_many(symbols)
+    data['symbol'] = data['symbol'].astype(str)
+    index = from_data(data, length, min_depth)
+    index.save(name)
+
+    return index
+
+
+def open_index(name='index'):
+    """Open a saved index."""
+    with np.load(_index_path(name)) as f:
+        table = pd.DataFrame({'symbol': f['symbols'][f['code']]})
+        for c in TABLE_COLUMNS:
+            table[c] = f[c]
+
+        return Index(f['trajectories'], f['lengths'], table)
+
+
+def load(name='index'):
+    """Open the saved index, rebuilding it if the store was updated after it was built."""
+    path = _index_path(name)
+    if os.path.exists(path) and (not os.path.exists(store._index_path()) or
+                                 os.path.getmtime(store._index_path()) <= os.path.getmtime(path)):
+        return open_index(name)
+
+    return build(name=name)
@@ -0,0 +1,244 @@
+"""
+Local append-only price store.
+
+Each symbol is kept in one columnar file under data/store, and a small
+JSON index records the range that has been fetched for it. update() only
+asks the downloader for the bars after the last stored one.
+
+The close ('value') plus open, high, low, adjusted close and volume are
+stored when the downloader provides them, with the fields other than the
+close as float32. Reads are projected to the requested columns, 'value'
+by default, and only those are loaded from disk. pack() puts a whole
+universe in one file with each row's symbol as an int32 code into a
+dictionary of names.
+"""
+
+import datetime as dt
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+import cache
+
+STORE_DIR = 'data/store'
+
+# Stored price fields, besides 'd'
+FIELDS = ('value', 'open', 'high', 'low', 'adj_close', 'volume')
+# Fields kept as float32: 7 significant digits are plenty for them, while
+# the analytics run on 'value', which stays float64
+FLOAT32_FIELDS = ('open', 'high', 'low', 'adj_close')
+
+_index_lock = threading.Lock()
+
+
+def _symbol_path(symbol):
+    return os.path.join(STORE_DIR, '{}.npz'.format(symbol))
+
+
+def _pack_path(name):
+    return os.path.join(STORE_DIR, '{}.pack.npz'.format(name))
+
+
+def _index_path():
+    return os.path.join(STORE_DIR, 'index.json')
+
+
+def load_index():
+    """Return the metadata index as {symbol: {'start', 'last', 'fetched', 'rows'}}."""
+    try:
+        with open(_index_path()) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _set_index_entry(symbol, entry):
+    with _index_lock:
+        index = load_index()
+        index[symbol] = entry
+        tmp = '{}.tmp'.format(_index_path())
+        with open(tmp, 'w') as f:
+            json.dump(index, f, indent=1, sort_keys=True)
+        os.replace(tmp, _index_path())
+
+
+def _columns(columns):
+    return None if columns is None else ['d'] + [c for c in columns if c != 'd']
+
+
+def read(symbol, columns=('value',)):
+    """
+    Return the stored bars for symbol, or None if it was never fetched.
+
+    Only 'd' and columns are loaded; None loads every stored field. FIELDS
+    missing from files written before they were stored come back as NaN,
+    other unknown columns raise KeyError.
+    """
+    path = _symbol_path(symbol)
+    if symbol not in load_index() or not os.path.exists(path):
+        return None
+    if columns is None:
+        return cache.load_columns(path)
+
+    columns = _columns(columns)
+    with np.load(path) as f:
+        stored = set(f.files)
+    unknown = [c for c in columns if c not in stored and c not in FIELDS]
+    if unknown:
+        raise KeyError('{} has no field(s) {}, stored: {}'.format(symbol, unknown, sorted(stored)))
+
+    data = cache.load_columns(path, [c for c in columns if c in stored])
+    for c in columns:
+        if c not in stored:
+            data[c] = np.nan
+
+    return data[columns]
+
+
+def read_series(symbol, dtype=np.float64):
+    """Return the stored bars for symbol as a prices.PriceSeries, or None."""
+    if symbol not in load_index() or not os.path.exists(_symbol_path(symbol)):
+        return None
+
+    return cache.load_series(_symbol_path(symbol), symbol, dtype)
+
+
+def update_series(symbol, start_date, downloader, end_date=None, dtype=np.float64):
+    """
+    update() returning a prices.PriceSeries from start_date on, read from
+    the stored file rather than converted from a frame.
+    """
+    _refresh(symbol, start_date, downloader, end_date)
+    series = read_series(symbol, dtype)
+    start = np.datetime64(pd.Timestamp(start_date).date(), 'D').astype(np.int64)
+
+    return series[np.searchsorted(series.days, start):]
+
+
+def read_many(symbols, columns=('value',)):
+    """
+    Return the stored bars of several symbols as one long (symbol, d, value)
+    frame, with symbol as a categorical.
+    """
+    frames = []
+    found = []
+    # A symbol listed twice is read once, in the order first listed
+    for symbol in dict.fromkeys(symbols):
+        data = read(symbol, columns)
+        if data is not None:
+            frames.append(data)
+            found.append(symbol)
+    if not frames:
+        return pd.DataFrame(columns=['symbol', 'd'] + list(columns or FIELDS))
+
+    codes = np.repeat(np.arange(len(found), dtype=np.int32), [len(data) for data in frames])
+    data = pd.concat(frames, ignore_index=True)
+    data.insert(0, 'symbol', pd.Categorical.from_codes(codes, found))
+
+    return _compact(data)
+
+
+def pack(name, symbols, columns=None):
+    """
+    Write the stored bars of symbols into one file, data/store/<name>.pack.npz.
+
+    Symbols are dictionary-encoded: the file holds the list of names once
+    and an int32 code per row. columns defaults to every stored field.
+    Returns the number of rows written.
+    """
+    data = read_many(symbols, columns)
+    arrays = {
+        'symbols': np.asarray(data['symbol'].cat.categories, dtype=str),
+        'code': data['symbol'].cat.codes.to_numpy(np.int32),
+    }
+    arrays.update({c: data[c].to_numpy() for c in data.columns if c != 'symbol'})
+    os.makedirs(STORE_DIR, exist_ok=True)
+    cache.save_arrays(_pack_path(name), **arrays)
+
+    return len(data)
+
+
+def read_pack(name, columns=('value',), symbols=None):
+    """
+    Read a pack() file as a long (symbol, d, <columns>) frame.
+
+    symbol is a categorical built from the stored codes, so no per-row
+    strings are created. symbols optionally selects some of them.
+    """
+    with np.load(_pack_path(name)) as f:
+        names = f['symbols']
+        codes = f['code']
+        rows = slice(None) if symbols is None else np.isin(codes, np.flatnonzero(np.isin(names, symbols)))
+        data = {'symbol': pd.Categorical.from_codes(codes[rows], names.tolist())}
+        data.update({c: f[c][rows] for c in _columns(columns or FIELDS) if c in f.files})
+
+    return pd.DataFrame(data)
+
+
+def _compact(data):
+    """Cast the FLOAT32_FIELDS of data to float32."""
+    return data.astype({c: np.float32 for c in FLOAT32_FIELDS if c in data.columns})
+
+
+def write(symbol, data, start_date):
+    os.makedirs(STORE_DIR, exist_ok=True)
+    data = _compact(data[['d'] + [c for c in FIELDS if c in data.columns]].reset_index(drop=True))
+    cache.save_columns(data, _symbol_path(symbol))
+    _set_index_entry(symbol, {
+        'start': pd.Timestamp(start_date).isoformat()[:10],
+        'last': data['d'].iloc[-1].isoformat()[:10] if len(data) else None,
+        'fetched': dt.datetime.now().isoformat(timespec='seconds'),
+        'rows': len(data),
+        'columns': list(data.columns[1:]),
+    })
+
+
+def _refresh(symbol, start_date, downloader, end_date=None):
+    """
+    Bring the stored history of symbol up to end_date and return every
+    stored field.
+
+    downloader(symbol, start, end) must return a frame with 'd' and 'value'
+    columns, and may add other FIELDS. It is called for the whole range
+    only when nothing is stored yet or start_date is earlier than what was
+    fetched before; otherwise it is asked for the tail starting at the last
+    stored bar, which is re-downloaded because it may have been a partial
+    session.
+    """
+    end_date = end_date or dt.datetime.now()
+    entry = load_index().get(symbol)
+    stored = read(symbol, None)
+
+    if stored is None or entry['last'] is None or \
+            pd.Timestamp(start_date) < pd.Timestamp(entry['start']):
+        data = downloader(symbol, start_date, end_date)
+        stored_start = start_date
+    else:
+        last = pd.Timestamp(entry['last'])
+        tail = downloader(symbol, last.to_pydatetime(), end_date)
+        if len(tail):
+            data = pd.concat([stored[stored['d'] < last], tail])
+        else:
+            data = stored
+        stored_start = entry['start']
+
+    data = data.drop_duplicates('d', keep='last').sort_values('d')
+    write(symbol, data, stored_start)
+
+    return data
+
+
+def update(symbol, start_date, downloader, end_date=None, columns=('value',)):
+    """
+    Bring the stored history of symbol up to end_date (see _refresh) and
+    return its 'd' and columns (every stored field for None) from
+    start_date on.
+    """
+    data = _refresh(symbol, start_date, downloader, end_date)
+    data = data[data['d'] >= pd.Timestamp(start_date)]
+    data = data[[c for c in _columns(columns or FIELDS) if c in data.columns]]
+
+    return _compact(data.reset_index(drop=True))
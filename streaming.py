@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Streaming drawdown monitor.
+
+Consumes price updates (symbol, d, value) from a file replay or a local
+socket, keeps the running peak, trough and drawdown of each symbol with
+O(1) work per update and emits an event whenever a drawdown threshold is
+crossed or a drawdown is recovered. Episodes follow process.episodes: a
+new one starts when a value exceeds the running peak.
+
+Usage:
+    python streaming.py --replay ticks.csv
+    python streaming.py --serve ticks.csv --port 9999   # stand-in feed
+    python streaming.py --connect localhost:9999 --thresholds -0.05 -0.1
+"""
+
+import argparse
+import csv
+import json
+import socket
+import socketserver
+import time
+
+import pandas as pd
+
+import process
+import store
+
+THRESHOLDS = (-0.1, -0.2, -0.3, -0.4, -0.5)
+
+
+class DrawdownTracker:
+    """Running drawdown state of one symbol."""
+
+    def __init__(self, symbol, thresholds=THRESHOLDS):
+        self.symbol = symbol
+        self.thresholds = sorted(thresholds, reverse=True)
+        self.peak = None
+        self.peak_d = None
+        self.trough = None
+        self.trough_d = None
+        self.last_d = None
+        self.days = 0
+        self._crossed = 0
+        # State before the current bar, restored when a tick revises it,
+        # and the events already sent for the current bar
+        self._before = self._state()
+        self._sent = set()
+
+    @classmethod
+    def from_history(cls, symbol, data, thresholds=THRESHOLDS):
+        """Start from the state a batch run over data (d, value) ends in."""
+        tracker = cls(symbol, thresholds)
+        if len(data) == 0:
+            return tracker
+
+        values = data['value'].to_numpy()
+        d = data['d'].to_numpy()
+        # State before the last bar, which is then applied as a live update
+        # so a tick on the same date can revise it
+        if len(values) > 1:
+            ep = process.episodes(values[:-1])
+            tracker.peak = ep['cummax'][-1]
+            tracker.peak_d = pd.Timestamp(d[ep['start'][-1]])
+            tracker.trough = ep['runmin'][-1]
+            tracker.trough_d = pd.Timestamp(d[ep['trough'][-1]])
+            tracker.last_d = pd.Timestamp(d[-2])
+            tracker.days = int(len(values) - 2 - ep['start'][-1])
+            tracker._skip_crossed(tracker.trough / tracker.peak - 1)
+        tracker.update(pd.Timestamp(d[-1]), values[-1])
+
+        return tracker
+
+    def _state(self):
+        return self.peak, self.peak_d, self.trough, self.trough_d, self.days, self._crossed
+
+    @property
+    def drawdown(self):
+        return self.trough / self.peak - 1 if self.peak else 0.0
+
+    def _skip_crossed(self, depth):
+        crossed = []
+        while self._crossed < len(self.thresholds) and depth <= self.thresholds[self._crossed]:
+            crossed.append(self.thresholds[self._crossed])
+            self._crossed += 1
+
+        return crossed
+
+    def _event(self, kind, d, value, **extra):
+        event = {
+            'symbol': self.symbol,
+            'event': kind,
+            'd': pd.Timestamp(d).isoformat()[:10],
+            'value': value,
+            'peak': self.peak,
+            'peak_d': self.peak_d.isoformat()[:10],
+            'drawdown': value / self.peak - 1,
+            'days': self.days,
+        }
+        event.update(extra)
+
+        return event
+
+    def update(self, d, value):
+        """
+        Apply one price update and return the events it triggers.
+
+        A tick dated like the current bar replaces it: the state from before
+        the bar is restored and the tick applied again, without repeating the
+        events already sent for the bar. Ticks older than the current bar
+        are dropped.
+        """
+        if self.last_d is not None and d < self.last_d:
+            return []
+        if self.last_d is not None and d == self.last_d:
+            (self.peak, self.peak_d, self.trough, self.trough_d, self.days,
+             self._crossed) = self._before
+        else:
+            self._before = self._state()
+            self._sent = set()
+            self.last_d = d
+
+        events = [event for event in self._apply(d, value)
+                  if (event['event'], event.get('threshold')) not in self._sent]
+        self._sent.update((event['event'], event.get('threshold')) for event in events)
+
+        return events
+
+    def _apply(self, d, value):
+        if self.peak is None or value > self.peak:
+            events = []
+            if self._crossed:
+                events.append(self._event('recovered', d, value, depth=self.drawdown))
+            self.peak = self.trough = value
+            self.peak_d = self.trough_d = d
+            self.days = 0
+            self._crossed = 0
+            return events
+
+        self.days += 1
+        if value < self.trough:
+            self.trough = value
+            self.trough_d = d
+
+        return [self._event('threshold', d, value, threshold=threshold)
+                for threshold in self._skip_crossed(value / self.peak - 1)]
+
+
+class Monitor:
+    """Trackers for every symbol seen on a feed."""
+
+    def __init__(self, thresholds=THRESHOLDS, seed_from_store=False):
+        self.thresholds = thresholds
+        self.seed_from_store = seed_from_store
+        self.trackers = {}
+
+    def tracker(self, symbol, before=None):
+        if symbol not in self.trackers:
+            history = store.read(symbol) if self.seed_from_store else None
+            if history is not None:
+                if before is not None:
+                    history = history[history['d'] < before]
+                self.trackers[symbol] = DrawdownTracker.from_history(symbol, history, self.thresholds)
+            else:
+                self.trackers[symbol] = DrawdownTracker(symbol, self.thresholds)
+
+        return self.trackers[symbol]
+
+    def update(self, symbol, d, value):
+        return self.tracker(symbol, d).update(d, value)
+
+    def run(self, feed):
+        """Yield the events of every update in feed."""
+        for symbol, d, value in feed:
+            yield from self.update(symbol, d, value)
+
+
+def _parse(row):
+    return row[0], pd.Timestamp(row[1]), float(row[2])
+
+
+def replay(path, delay=0):
+    """Read updates from a CSV file with symbol,d,value rows (header optional)."""
+    with open(path, newline='') as f:
+        for row in csv.reader(f):
+            if not row or row[0] == 'symbol':
+                continue
+            yield _parse(row)
+            if delay:
+                time.sleep(delay)
+
+
+def socket_feed(host, port):
+    """Read symbol,d,value lines from a TCP feed until it closes."""
+    with socket.create_connection((host, port)) as conn, conn.makefile('r') as f:
+        for line in f:
+            row = line.strip().split(',')
+            if len(row) == 3 and row[0] != 'symbol':
+                yield _parse(row)
+
+
+def serve(path, host='localhost', port=9999, delay=0):
+    """Stand-in feed: stream the lines of a replay file to each client."""
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            with open(path, 'rb') as f:
+                for line in f:
+                    self.wfile.write(line)
+                    if delay:
+                        time.sleep(delay)
+
+    with socketserver.ThreadingTCPServer((host, port), Handler) as server:
+        print(f"Serving {path} on {host}:{port}")
+        server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Streaming drawdown monitor')
+    parser.add_argument('--replay', type=str, help='CSV file of symbol,d,value updates')
+    parser.add_argument('--connect', type=str, help='host:port of a line-based feed')
+    parser.add_argument('--serve', type=str, help='Serve a replay file as a local feed')
+    parser.add_argument('--port', type=int, default=9999, help='Port for --serve (default: 9999)')
+    parser.add_argument('--delay', type=float, default=0, help='Seconds between replayed updates')
+    parser.add_argument('--thresholds', type=float, nargs='+', default=list(THRESHOLDS),
+                        help='Drawdown levels that trigger events (default: -0.1 ... -0.5)')
+    parser.add_argument('--seed-from-store', action='store_true',
+                        help='Start each symbol from its history in the local price store')
+
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, port=args.port, delay=args.delay)
+        return
+
+    if args.connect:
+        host, port = args.connect.rsplit(':', 1)
+        feed = socket_feed(host, int(port))
+    elif args.replay:
+        feed = replay(args.replay, args.delay)
+    else:
+        parser.error('one of --replay, --connect or --serve is required')
+
+    monitor = Monitor(args.thresholds, args.seed_from_store)
+    for event in monitor.run(feed):
+        print(json.dumps(event))
+
+
+if __name__ == "__main__":
+    main()
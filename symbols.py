@@ -264,3 +264,10 @@ sp500 = [
     'BLK',
     'SYK',
 ]
+
+# Yahoo tickers for each universe, B3 listings need the .SA suffix
+universes = {
+    'ibrxa': ['{}.SA'.format(symbol) for symbol in ibrxa_symbols],
+    'interest': interest,
+    'sp500': sp500,
+}
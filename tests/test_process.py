@@ -0,0 +1,150 @@
+"""
+The vectorized process functions against the loop and groupby versions
+they replaced, kept here as the reference.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import process
+
+
+def reference_crashes(raw_data):
+    data = raw_data[['d', 'value']].copy()
+    data = data.reset_index(drop=True)
+    ath = data['value'].max()
+    data['cummax'] = data['value'].cummax()
+    data['min'] = data.groupby('cummax')['value'].transform('min')
+    data = data[::-1]
+    data['cummin'] = data.groupby('cummax')['value'].agg('cummin')
+    data = data[::-1]
+    data = data[(data['cummin'] == data['min']) | (data['cummax'] == ath)]
+    data = data.reset_index(drop=True)
+    data['ord_d'] = data.groupby('cummax').cumcount()
+    data['delta'] = data.groupby('cummax')['value'].transform('first')
+    data['delta'] = data['value'] / data['delta'] - 1
+
+    return data[['ord_d', 'd', 'value', 'delta', 'cummax']]
+
+
+def reference_drawdown(raw_data):
+    data = raw_data[['d', 'value']].copy()
+    data['factor'] = data['value'].diff().fillna(0)
+    data['factor'] = data['value'] / (data['value'] - data['factor'])
+
+    drawdown = []
+    current_drawdown = 1
+    for i in np.arange(len(data['factor'])):
+        current_drawdown = min(current_drawdown * data['factor'][i], 1)
+        drawdown.append(current_drawdown)
+
+    data['drawdown'] = drawdown
+
+    return data
+
+
+def reference_recover(raw_data):
+    data = raw_data[['d', 'value']].copy()
+    data['delta'] = data['value'].diff().fillna(0)
+    data['delta'] = data['delta'] / (data['value'] - data['delta']) + 1
+
+    data['cummax'] = data['value'].cummax()
+    data['cumdelta'] = data.groupby('cummax')['delta'].cumprod()
+    data['min'] = data.groupby('cummax')['cumdelta'].transform('min')
+    data['cumdelta'] = data['cumdelta'] / data['min']
+    data['cumdelta'] = data['cumdelta'] - 1
+
+    data['ord_d'] = data.groupby('cummax').cumcount()
+    min_idx = data.groupby('cummax')['value'].idxmin().to_dict()
+    data['ord_d'] = data['ord_d'] - \
+        data['cummax'].map(min_idx).apply(lambda x: data.iloc[x]['ord_d'] if x in data.index else 0)
+
+    return data
+
+
+def random_walk(n, seed, repeats=False, end_in_drawdown=False):
+    rng = np.random.default_rng(seed)
+    steps = rng.normal(0.0003, 0.012, n)
+    if end_in_drawdown:
+        steps[-n // 5:] -= 0.004
+    values = 100 * np.exp(np.cumsum(steps))
+    if repeats:
+        # Whole prices repeat, peaks and lows included, and some days are flat
+        values = np.round(values)
+        flat = rng.random(n) < 0.1
+        flat[0] = False
+        idx = np.where(flat, 0, np.arange(n))
+        values = values[np.maximum.accumulate(idx)]
+
+    return pd.DataFrame({'d': pd.bdate_range('1990-01-01', periods=n), 'value': values})
+
+
+CASES = [
+    dict(n=2_000, seed=0),
+    dict(n=2_000, seed=1, repeats=True),
+    dict(n=2_000, seed=2, end_in_drawdown=True),
+    dict(n=2_000, seed=3, repeats=True, end_in_drawdown=True),
+    dict(n=1, seed=4),
+]
+
+
+@pytest.fixture(params=CASES, ids=lambda case: '-'.join('{}={}'.format(*item) for item in case.items()))
+def data(request):
+    return random_walk(**request.param)
+
+
+def test_crashes(data):
+    expected = reference_crashes(data)
+    result = process.crashes.uncached(data)
+
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+
+def test_drawdown(data):
+    expected = reference_drawdown(data)
+    result = process.drawdown.uncached(data)
+
+    pd.testing.assert_frame_equal(result[expected.columns], expected, check_dtype=False)
+
+
+def test_recover(data):
+    expected = reference_recover(data)
+    result = process.recover.uncached(data)
+
+    pd.testing.assert_frame_equal(result[expected.columns], expected, check_dtype=False)
+
+
+def test_ends_in_drawdown():
+    data = random_walk(2_000, 2, end_in_drawdown=True)
+    assert data['value'].iloc[-1] < data['value'].max()
+    assert process.drawdown.uncached(data)['drawdown'].iloc[-1] < 1
+
+
+def test_crash_state(data):
+    state = process.CrashState()
+    for start in range(0, len(data), 97):
+        # Overlapping chunks, each revising the previous chunk's last bar
+        state.update(data[max(start - 1, 0):start + 97])
+    expected = process.crashes.uncached(data)
+
+    pd.testing.assert_frame_equal(state.frame(data), expected, check_dtype=False)
+    pd.testing.assert_frame_equal(process.CrashState.from_data(data).frame(data), expected,
+                                  check_dtype=False)
+
+
+def test_update_crashes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    full = random_walk(3_000, 5, repeats=True)
+    # A partial last session later revised, up to a new all-time high
+    partial = full[:2_051].copy()
+    partial.loc[2_050, 'value'] *= 0.9
+    revised = full[:2_100].copy()
+    revised.loc[2_099, 'value'] = full['value'].max() * 1.1
+    shorter = full[10:2_000].reset_index(drop=True)
+
+    for data in (full[:2_000], partial, full[:2_100], revised, full, shorter):
+        expected = process.crashes.uncached(data)
+        result = process.update_crashes(data, '^TEST')
+
+        pd.testing.assert_frame_equal(result, expected, check_dtype=False)
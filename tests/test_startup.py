@@ -0,0 +1,33 @@
+"""main.py --help and query must start without loading the heavy libraries."""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main.py')
+HEAVY_MODULES = ('matplotlib', 'seaborn', 'yfinance')
+
+# Runs main.py as __main__ and prints the heavy modules it left in sys.modules
+SCRIPT = '''
+import json, os, runpy, sys
+sys.path.insert(0, os.path.dirname({main!r}))
+sys.argv = [{main!r}] + {args!r}
+try:
+    runpy.run_path({main!r}, run_name='__main__')
+except SystemExit:
+    pass
+print(json.dumps(sorted(name for name in sys.modules if name.split('.')[0] in {heavy!r})))
+'''
+
+
+@pytest.mark.parametrize('args', [['--help'], ['query', '^GSPC']], ids=['help', 'query'])
+def test_no_heavy_imports(args, tmp_path):
+    script = SCRIPT.format(main=MAIN, args=args, heavy=HEAVY_MODULES)
+    # An empty directory: query finds no store and only prints a hint
+    result = subprocess.run([sys.executable, '-c', script], cwd=tmp_path, capture_output=True,
+                            text=True, check=True)
+
+    assert json.loads(result.stdout.splitlines()[-1]) == []
@@ -0,0 +1,107 @@
+"""
+store.update() against a stub downloader serving a fixed history, so the
+merge of stored and downloaded bars is checked offline.
+"""
+
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import store
+
+DATES = pd.bdate_range('2020-01-01', '2020-12-31')
+
+
+class StubDownloader:
+    """Serves bars of a fixed history between start and end, recording each call."""
+
+    def __init__(self, values=None):
+        self.values = np.arange(len(DATES), dtype=np.float64) + 100 if values is None else values
+        self.calls = []
+
+    def __call__(self, symbol, start, end):
+        self.calls.append((symbol, pd.Timestamp(start), pd.Timestamp(end)))
+        rows = (DATES >= pd.Timestamp(start)) & (DATES < pd.Timestamp(end))
+
+        return pd.DataFrame({'d': DATES[rows], 'value': self.values[rows],
+                             'volume': self.values[rows] * 10})
+
+
+@pytest.fixture(autouse=True)
+def tmp_store(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+
+def expected(downloader, start, end):
+    rows = (DATES >= pd.Timestamp(start)) & (DATES < pd.Timestamp(end))
+
+    return pd.DataFrame({'d': DATES[rows], 'value': downloader.values[rows]}).reset_index(drop=True)
+
+
+def test_first_update_downloads_the_range():
+    downloader = StubDownloader()
+    data = store.update('^T', dt.datetime(2020, 3, 2), downloader, dt.datetime(2020, 6, 1))
+
+    assert downloader.calls == [('^T', pd.Timestamp('2020-03-02'), pd.Timestamp('2020-06-01'))]
+    pd.testing.assert_frame_equal(data, expected(downloader, '2020-03-02', '2020-06-01'), check_freq=False)
+
+    entry = store.load_index()['^T']
+    assert entry['start'] == '2020-03-02'
+    assert entry['last'] == '2020-05-29'
+    assert entry['rows'] == len(data)
+    assert entry['columns'] == ['value', 'volume']
+
+
+def test_update_redownloads_the_last_bar():
+    downloader = StubDownloader()
+    store.update('^T', dt.datetime(2020, 3, 2), downloader, dt.datetime(2020, 6, 1))
+
+    # The last stored session closed at another price than first downloaded
+    downloader.values = downloader.values.copy()
+    downloader.values[DATES == '2020-05-29'] = 1.0
+    data = store.update('^T', dt.datetime(2020, 3, 2), downloader, dt.datetime(2020, 7, 1))
+
+    assert downloader.calls[-1][1:] == (pd.Timestamp('2020-05-29'), pd.Timestamp('2020-07-01'))
+    pd.testing.assert_frame_equal(data, expected(downloader, '2020-03-02', '2020-07-01'), check_freq=False)
+    assert data['d'].is_unique
+    assert store.load_index()['^T']['last'] == '2020-06-30'
+    assert store.load_index()['^T']['rows'] == len(data)
+
+
+def test_empty_tail_keeps_the_store():
+    downloader = StubDownloader()
+    first = store.update('^T', dt.datetime(2020, 3, 2), downloader, dt.datetime(2020, 6, 1))
+    entry = store.load_index()['^T']
+
+    def empty(symbol, start, end):
+        return downloader(symbol, start, start)
+
+    data = store.update('^T', dt.datetime(2020, 3, 2), empty, dt.datetime(2020, 7, 1))
+
+    pd.testing.assert_frame_equal(data, first)
+    assert {k: v for k, v in store.load_index()['^T'].items() if k != 'fetched'} == \
+        {k: v for k, v in entry.items() if k != 'fetched'}
+
+
+def test_earlier_start_date_downloads_everything():
+    downloader = StubDownloader()
+    store.update('^T', dt.datetime(2020, 3, 2), downloader, dt.datetime(2020, 6, 1))
+    data = store.update('^T', dt.datetime(2020, 1, 6), downloader, dt.datetime(2020, 6, 1))
+
+    assert downloader.calls[-1][1:] == (pd.Timestamp('2020-01-06'), pd.Timestamp('2020-06-01'))
+    pd.testing.assert_frame_equal(data, expected(downloader, '2020-01-06', '2020-06-01'), check_freq=False)
+    assert store.load_index()['^T']['start'] == '2020-01-06'
+
+
+def test_later_start_date_reads_from_the_store():
+    downloader = StubDownloader()
+    store.update('^T', dt.datetime(2020, 3, 2), downloader, dt.datetime(2020, 6, 1))
+    data = store.update('^T', dt.datetime(2020, 4, 1), downloader, dt.datetime(2020, 6, 1),
+                        columns=('value', 'volume'))
+
+    assert downloader.calls[-1][1] == pd.Timestamp('2020-05-29')
+    assert data['d'].iloc[0] == pd.Timestamp('2020-04-01')
+    assert list(data.columns) == ['d', 'value', 'volume']
+    assert store.load_index()['^T']['start'] == '2020-03-02'
@@ -0,0 +1,65 @@
+"""
+DrawdownTracker: ticks revising the current bar, and seeding from history
+against streaming the same bars.
+"""
+
+import numpy as np
+import pandas as pd
+
+import streaming
+
+DAY1, DAY2, DAY3 = pd.Timestamp('2024-01-02'), pd.Timestamp('2024-01-03'), pd.Timestamp('2024-01-04')
+
+
+def kinds(events):
+    return [(event['event'], event.get('threshold')) for event in events]
+
+
+def test_same_day_ticks_cross_once():
+    tracker = streaming.DrawdownTracker('^T', thresholds=(-0.1, -0.2))
+    assert tracker.update(DAY1, 100.0) == []
+
+    assert tracker.update(DAY2, 95.0) == []
+    events = tracker.update(DAY2, 85.0)
+    assert kinds(events) == [('threshold', -0.1)]
+    assert events[0]['value'] == 85.0
+    assert tracker.trough == 85.0 and tracker.days == 1
+
+    # The crossing stays recorded on the next day
+    assert tracker.update(DAY3, 84.0) == []
+    assert tracker.days == 2
+
+
+def test_repeated_same_day_ticks_do_not_repeat_events():
+    tracker = streaming.DrawdownTracker('^T', thresholds=(-0.1, -0.2))
+    tracker.update(DAY1, 100.0)
+
+    assert kinds(tracker.update(DAY2, 85.0)) == [('threshold', -0.1)]
+    for value in (85.0, 84.0, 89.0, 85.0):
+        assert tracker.update(DAY2, value) == []
+    assert kinds(tracker.update(DAY2, 79.0)) == [('threshold', -0.2)]
+    assert tracker.update(DAY2, 79.0) == []
+    assert tracker.days == 1
+
+    # Ticks older than the current bar are dropped
+    assert tracker.update(DAY1, 50.0) == []
+    assert tracker.trough == 79.0
+
+
+def test_from_history_matches_streaming():
+    rng = np.random.default_rng(0)
+    values = np.round(100 * np.exp(np.cumsum(rng.normal(0, 0.02, 600))))
+    data = pd.DataFrame({'d': pd.bdate_range('2000-01-03', periods=len(values)), 'value': values})
+
+    streamed = streaming.DrawdownTracker('^T')
+    for i, (d, value) in enumerate(zip(data['d'], data['value'])):
+        streamed.update(d, value)
+        seeded = streaming.DrawdownTracker.from_history('^T', data[:i + 1])
+
+        assert seeded._state() == streamed._state()
+        assert seeded.last_d == streamed.last_d
+        assert seeded._before == streamed._before
+
+    # And both react alike to a revision of the last bar and a new one
+    for d, value in ((data['d'].iloc[-1], values.min() * 0.5), (pd.Timestamp('2030-01-01'), 1e6)):
+        assert seeded.update(d, value) == streamed.update(d, value)